@@ -0,0 +1,111 @@
+# adaptive_limit.py
+import asyncio
+import time
+from collections import deque
+
+SUCCESS, ERROR, TIMEOUT = "ok", "errore", "timeout"
+
+ADDITIVE_INCREASE = 1.0           # +1 slot ogni "limit" risposte buone, cioè circa +1 per giro di richieste
+MULTIPLICATIVE_DECREASE = 0.5
+LATENCY_TOLERANCE = 3.0           # latenza oltre baseline * tolleranza = host (o rete) in affanno
+LATENCY_FLOOR_SECONDS = 0.5       # sotto questa latenza non si riduce mai, anche se la baseline è minuscola
+ERROR_RATE_THRESHOLD = 0.25       # errori isolati (un 503) non sono congestione, una raffica sì
+EWMA_WEIGHT = 0.1
+
+
+class AdaptiveLimiter:
+    """
+    Limite di richieste in volo regolato in stile AIMD (come il controllo di congestione TCP):
+    cresce di poco a ogni risposta veloce e si dimezza su timeout, su un tasso d'errore oltre soglia
+    o su latenze molto sopra la baseline osservata. Dopo una riduzione le risposte delle richieste
+    già in volo non la ripetono (al massimo una riduzione per latenza media), così una raffica di
+    timeout correlati non porta il limite subito al minimo. Da usare solo dal thread dell'event loop.
+    """
+
+    def __init__(self, initial_limit, min_limit=1, max_limit=None):
+        self.min_limit = min_limit
+        self.max_limit = max_limit or max(initial_limit, min_limit)
+        self.limit = float(min(max(initial_limit, min_limit), self.max_limit))
+        self.in_flight = 0
+        self.latency_ewma, self.baseline_latency = None, None
+        self.error_rate, self.timeout_rate = 0.0, 0.0
+        self.increases, self.decreases = 0, 0
+        self._last_decrease = 0.0
+        self._waiters = deque()
+
+    @property
+    def current_limit(self):
+        return max(self.min_limit, int(self.limit))
+
+    async def acquire(self):
+        if self.in_flight < self.current_limit and not self._waiters:
+            self.in_flight += 1
+            return
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+        try:
+            await waiter
+        except asyncio.CancelledError:
+            if waiter.done() and not waiter.cancelled():
+                self._release_slot()  # Slot già assegnato a chi è stato annullato: va restituito.
+            else:
+                try:
+                    self._waiters.remove(waiter)
+                except ValueError:
+                    pass  # Già tolto da _wake_waiters, che scarta i futuri annullati senza assegnare lo slot.
+            raise
+
+    def release(self, outcome=None, latency=None):
+        """Libera lo slot; outcome (SUCCESS/ERROR/TIMEOUT) e latency aggiornano il limite, None = nessun segnale."""
+        if outcome is not None:
+            self.record(outcome, latency)
+        self._release_slot()
+
+    def _release_slot(self):
+        self.in_flight -= 1
+        self._wake_waiters()
+
+    def _wake_waiters(self):
+        while self._waiters and self.in_flight < self.current_limit:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                self.in_flight += 1
+                waiter.set_result(None)
+
+    def record(self, outcome, latency=None):
+        self.error_rate += EWMA_WEIGHT * ((outcome == ERROR) - self.error_rate)
+        self.timeout_rate += EWMA_WEIGHT * ((outcome == TIMEOUT) - self.timeout_rate)
+        if outcome == SUCCESS and latency is not None:
+            self.latency_ewma = latency if self.latency_ewma is None else \
+                self.latency_ewma + EWMA_WEIGHT * (latency - self.latency_ewma)
+            # La baseline segue subito i minimi e risale lentamente, per adattarsi a un link che cambia.
+            self.baseline_latency = latency if self.baseline_latency is None or latency < self.baseline_latency \
+                else self.baseline_latency + 0.01 * (latency - self.baseline_latency)
+
+        congested = outcome == TIMEOUT or (outcome == ERROR and self.error_rate > ERROR_RATE_THRESHOLD)
+        if outcome == SUCCESS and latency is not None and self.baseline_latency is not None:
+            congested = latency > max(LATENCY_FLOOR_SECONDS, self.baseline_latency * LATENCY_TOLERANCE)
+        if congested:
+            self._decrease()
+        elif outcome == SUCCESS:
+            previous = self.current_limit
+            self.limit = min(self.max_limit, self.limit + ADDITIVE_INCREASE / self.limit)
+            if self.current_limit > previous:
+                self.increases += 1
+                self._wake_waiters()
+
+    def _decrease(self):
+        now = time.monotonic()
+        if now - self._last_decrease < (self.latency_ewma or LATENCY_FLOOR_SECONDS):
+            return
+        self._last_decrease = now
+        previous = self.current_limit
+        self.limit = max(self.min_limit, self.limit * MULTIPLICATIVE_DECREASE)
+        if self.current_limit < previous:
+            self.decreases += 1
+
+    def stats(self):
+        return {"limite": self.current_limit, "in_volo": self.in_flight, "in_attesa": len(self._waiters),
+                "latenza_media_s": round(self.latency_ewma, 3) if self.latency_ewma is not None else None,
+                "tasso_errori": round(self.error_rate, 3), "tasso_timeout": round(self.timeout_rate, 3),
+                "aumenti": self.increases, "riduzioni": self.decreases}
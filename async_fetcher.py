@@ -0,0 +1,257 @@
+# async_fetcher.py
+import asyncio
+import threading
+import time
+from contextlib import asynccontextmanager
+from urllib.parse import urlparse
+
+import httpx
+
+from response_limits import read_capped_async, MAX_BODY_BYTES
+from metrics import get_metrics, bind_metrics, run_with_metrics, STAGE_HTTP
+from adaptive_limit import AdaptiveLimiter, SUCCESS, ERROR, TIMEOUT
+
+RETRYABLE_STATUS_CODES = (500, 502, 503, 504)
+INITIAL_IN_FLIGHT = 32  # Punto di partenza del limite globale adattivo; max_in_flight resta il tetto.
+MIN_IN_FLIGHT = 4
+MAX_PER_HOST = 16
+CHALLENGE_STATUS_CODES = (403, 503)
+
+
+class CloudflareChallengeError(Exception):
+    """Pagina protetta da una challenge Cloudflare non superata: non è un guasto del dominio."""
+
+
+def is_cloudflare_challenge(status_code, headers):
+    """403/503 serviti da Cloudflare (header Server o cf-mitigated): challenge, non errore del sito."""
+    if status_code not in CHALLENGE_STATUS_CODES:
+        return False
+    return headers.get("cf-mitigated", "").lower() == "challenge" or \
+        "cloudflare" in headers.get("server", "").lower()
+
+
+class AsyncFetchEngine:
+    """
+    Motore di fetch asincrono condiviso da tutte le ricerche.
+    Gira su un event loop dedicato in un thread di background, con un unico pool di connessioni,
+    un limite globale di richieste in volo, un limite per host e backoff non bloccante.
+    Con adaptive=True entrambi i limiti sono regolati in stile AIMD (adaptive_limit) da latenza,
+    errori (solo per host) e timeout osservati: partono da initial_in_flight e per_host_limit e restano tra
+    MIN_IN_FLIGHT..max_in_flight e 1..max_per_host. Con adaptive=False sono fissi.
+    httpx non supera le challenge Cloudflare: quelle pagine passano a challenge_fallback (funzione
+    sincrona url -> risposta, es. cloudscraper) eseguita in un thread, senza contare come guasti del dominio.
+    """
+
+    def __init__(self, max_in_flight=200, per_host_limit=4, timeout=8, max_retries=2, backoff_factor=0.3,
+                 headers=None, cache=None, max_body_bytes=MAX_BODY_BYTES, parse_pool=None, adaptive=True,
+                 initial_in_flight=INITIAL_IN_FLIGHT, max_per_host=MAX_PER_HOST, challenge_fallback=None):
+        self.max_in_flight = max_in_flight
+        self.per_host_limit = per_host_limit
+        self.adaptive = adaptive
+        self.initial_in_flight = min(initial_in_flight, max_in_flight)
+        self.max_per_host = max(max_per_host, per_host_limit)
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.backoff_factor = backoff_factor
+        self.headers = headers or {}
+        self.cache = cache
+        self.max_body_bytes = max_body_bytes
+        self.parse_pool = parse_pool  # Opzionale (parse_pool.ParsePool): parsing delle pagine in processi separati.
+        self.challenge_fallback = challenge_fallback
+        self._loop = None
+        self._thread = None
+        self._client = None
+        self._global_limiter = None
+        self._host_limiters = {}
+        self._start_lock = threading.Lock()
+
+    def start(self):
+        with self._start_lock:
+            if self._loop is not None:
+                return
+            loop = asyncio.new_event_loop()
+            ready = threading.Event()
+
+            def _run_loop():
+                asyncio.set_event_loop(loop)
+                self._client = httpx.AsyncClient(
+                    headers=self.headers,
+                    timeout=self.timeout,
+                    follow_redirects=True,
+                    limits=httpx.Limits(max_connections=self.max_in_flight,
+                                        max_keepalive_connections=self.max_in_flight // 2),
+                )
+                if self.adaptive:
+                    self._global_limiter = AdaptiveLimiter(self.initial_in_flight, MIN_IN_FLIGHT, self.max_in_flight)
+                else:
+                    self._global_limiter = AdaptiveLimiter(self.max_in_flight, self.max_in_flight, self.max_in_flight)
+                ready.set()
+                loop.run_forever()
+
+            self._thread = threading.Thread(target=_run_loop, name="async-fetch-engine", daemon=True)
+            self._thread.start()
+            ready.wait()
+            self._loop = loop
+
+    def submit(self, coro):
+        """
+        Pianifica una coroutine sul loop del motore e restituisce un concurrent.futures.Future.
+        La coroutine registra le metriche nel registro attivo di chi la sottomette (la sua ricerca).
+        """
+        self.start()
+        return asyncio.run_coroutine_threadsafe(run_with_metrics(get_metrics(), coro), self._loop)
+
+    def close(self):
+        with self._start_lock:
+            if self._loop is None:
+                return
+            asyncio.run_coroutine_threadsafe(self._shutdown(), self._loop).result()
+            self._loop.call_soon_threadsafe(self._loop.stop)
+            self._thread.join()
+            self._loop.close()
+            self._loop, self._thread, self._client = None, None, None
+            self._host_limiters.clear()
+            if self.parse_pool:
+                self.parse_pool.close()
+                self.parse_pool = None
+
+    async def _shutdown(self):
+        # Le richieste ancora in volo (es. aziende annullate a obiettivo raggiunto) vengono chiuse
+        # prima di fermare il loop, così nessun task resta pendente.
+        tasks = [t for t in asyncio.all_tasks() if t is not asyncio.current_task()]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        await self._client.aclose()
+
+    def _host_limiter(self, netloc):
+        # Accesso solo dal thread dell'event loop: nessun lock necessario.
+        limiter = self._host_limiters.get(netloc)
+        if limiter is None:
+            min_limit, max_limit = (1, self.max_per_host) if self.adaptive else (self.per_host_limit, self.per_host_limit)
+            limiter = self._host_limiters[netloc] = AdaptiveLimiter(self.per_host_limit, min_limit, max_limit)
+        return limiter
+
+    @asynccontextmanager
+    async def _request_slot(self, netloc):
+        """Slot per una richiesta (prima quello dell'host, poi quello globale); l'esito aggiorna i due limiti."""
+        host_limiter = self._host_limiter(netloc)
+        await host_limiter.acquire()
+        try:
+            await self._global_limiter.acquire()
+        except BaseException:
+            host_limiter.release()
+            raise
+        started, outcome = time.monotonic(), SUCCESS
+        try:
+            yield
+        except httpx.TimeoutException:
+            outcome = TIMEOUT
+            raise
+        except httpx.HTTPStatusError as eHttp:
+            outcome = ERROR if eHttp.response.status_code in RETRYABLE_STATUS_CODES else SUCCESS
+            raise
+        except httpx.TransportError:
+            outcome = ERROR
+            raise
+        except BaseException:
+            outcome = None  # Annullamenti ed errori non di rete non dicono nulla sulla capacità dell'host.
+            raise
+        finally:
+            latency = time.monotonic() - started
+            # Un 5xx o una connessione rifiutata riguardano quell'host, non la capacità complessiva:
+            # il limite globale reagisce solo a timeout e latenza.
+            self._global_limiter.release(None if outcome == ERROR else outcome, latency)
+            host_limiter.release(outcome, latency)
+            metrics = get_metrics()
+            metrics.set_gauge("limite_globale", self._global_limiter.current_limit)
+            metrics.set_gauge("richieste_in_volo", self._global_limiter.in_flight)
+
+    def concurrency_stats(self):
+        """Limiti scelti dal controllo adattivo: globale e host rallentati (limite sotto per_host_limit)."""
+        if self._global_limiter is None:
+            return {"globale": None, "host_rallentati": {}}
+        throttled = {netloc: limiter.current_limit for netloc, limiter in list(self._host_limiters.items())
+                     if limiter.current_limit < self.per_host_limit}
+        get_metrics().set_gauge("host_rallentati", len(throttled))
+        return {"globale": self._global_limiter.stats(), "host_rallentati": throttled}
+
+    async def _get_challenged(self, url):
+        """Pagina dietro una challenge Cloudflare: la scarica challenge_fallback in un thread del loop."""
+        get_metrics().inc("cloudflare_challenge")
+        if self.challenge_fallback is None:
+            raise CloudflareChallengeError(f"Challenge Cloudflare su {url}.")
+        response = await asyncio.get_running_loop().run_in_executor(None, bind_metrics(self.challenge_fallback), url)
+        if response is None or response.status_code >= 400 or \
+                is_cloudflare_challenge(response.status_code, response.headers):
+            status = response.status_code if response is not None else "nessuna risposta"
+            raise CloudflareChallengeError(f"Challenge Cloudflare non superata su {url} ({status}).")
+        if self.cache:
+            self.cache.store(url, response)
+        return response
+
+    async def get(self, url, domain_health):
+        """Equivalente asincrono di scraping.get_with_retries: stessa gestione di retry, cache e salute domini."""
+        try:
+            current_netloc = urlparse(url).netloc
+        except Exception as e_parse_url:
+            raise Exception(f"URL malformato: {url} - {e_parse_url}")
+
+        cached_entry, fresh = self.cache.lookup(url) if self.cache else (None, False)
+        if fresh:
+            return self.cache.to_response(cached_entry)
+        metrics = get_metrics()
+        if not domain_health.allow_request(current_netloc):
+            metrics.inc("blacklist_hit")
+            raise Exception(f"Dominio {current_netloc} blacklistato.")
+        request_headers = self.cache.validation_headers(cached_entry) if self.cache else {}
+
+        for attempt in range(self.max_retries):
+            if attempt: metrics.inc("http_retry")
+            try:
+                # Corpo letto in streaming: Content-Type e Content-Length vengono controllati prima di
+                # scaricarlo e la lettura si ferma a max_body_bytes. L'attesa di uno slot resta fuori
+                # dalla latenza HTTP misurata.
+                async with self._request_slot(current_netloc):
+                    metrics.inc("http_richieste")
+                    with metrics.timer(STAGE_HTTP):
+                        started = time.monotonic()
+                        async with self._client.stream("GET", url, headers=request_headers) as streamed:
+                            challenged = is_cloudflare_challenge(streamed.status_code, streamed.headers)
+                            if challenged:
+                                # Il server risponde: il dominio è vivo anche se la pagina è protetta.
+                                domain_health.record_success(current_netloc, time.monotonic() - started)
+                            else:
+                                if streamed.status_code not in RETRYABLE_STATUS_CODES:
+                                    domain_health.record_success(current_netloc, time.monotonic() - started)
+                                if streamed.status_code == 304 and cached_entry:
+                                    return self.cache.mark_revalidated(url, cached_entry)
+                                streamed.raise_for_status()
+                                response = await read_capped_async(streamed, self.max_body_bytes)
+                if challenged:
+                    return await self._get_challenged(url)
+                if self.cache:
+                    self.cache.store(url, response)
+                return response
+            except CloudflareChallengeError:
+                raise  # Riprovare non serve e il dominio non va segnato come guasto.
+            except (httpx.ConnectError, httpx.TimeoutException, httpx.TooManyRedirects) as e:
+                metrics.inc("http_errori")
+                if attempt == self.max_retries - 1:
+                    domain_health.record_failure(current_netloc, e)
+                    raise Exception(f"Max retries {url}. Err:{type(e).__name__}") from e
+            except httpx.HTTPStatusError as eHttp:
+                metrics.inc("http_errori")
+                if eHttp.response.status_code not in RETRYABLE_STATUS_CODES:
+                    raise
+                if attempt == self.max_retries - 1:
+                    domain_health.record_failure(current_netloc, eHttp)
+                    raise
+            except Exception as eGeneral:
+                metrics.inc("http_errori")
+                if attempt == self.max_retries - 1:
+                    if any(k in str(eGeneral).lower() for k in ("resolve", "socket", "connection")):
+                        domain_health.record_failure(current_netloc, eGeneral)
+                    raise
+            await asyncio.sleep(self.backoff_factor * (2 ** attempt))
+        return None
@@ -0,0 +1,95 @@
+# benchmarks/bench_extraction.py
+# Micro-benchmark di extract_emails_and_piva sulle pagine salvate in benchmarks/pages.
+# Uso: python benchmarks/bench_extraction.py [--pages DIR] [--repeat N]
+import argparse
+import os
+import re
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bs4 import BeautifulSoup
+
+from extraction import extract_emails_and_piva, PARTITA_IVA_REGEX
+from utils import clean_valid_emails, EMAIL_CANDIDATE_REGEX, PRIORITY_KEYWORDS
+
+PAGES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "pages")
+
+
+def legacy_extract_emails_and_piva(html_text, url_context=""):
+    """Implementazione originale (html.parser + tre get_text), tenuta qui solo come riferimento."""
+    soup = BeautifulSoup(html_text, "html.parser")
+    mailtos = [a.get("href")[7:] for a in soup.find_all("a", href=True) if a.get("href", "").startswith("mailto:")]
+    text_content = soup.get_text().lower()
+    text_emails = re.findall(EMAIL_CANDIDATE_REGEX, text_content)
+    partita_iva_match = re.search(PARTITA_IVA_REGEX, text_content)
+    if not partita_iva_match: partita_iva_match = re.search(PARTITA_IVA_REGEX, html_text)
+    header_emails, footer_emails = [], []
+    header = soup.find("header")
+    if header and header.get_text(): header_emails = re.findall(EMAIL_CANDIDATE_REGEX, header.get_text().lower())
+    footer = soup.find("footer")
+    if footer and footer.get_text(): footer_emails = re.findall(EMAIL_CANDIDATE_REGEX, footer.get_text().lower())
+    filtered_emails = clean_valid_emails(list(set(mailtos + text_emails + header_emails + footer_emails)))
+    filtered_emails.sort(key=lambda e: (not any(k in e for k in PRIORITY_KEYWORDS), e))
+    return filtered_emails[:3], bool(partita_iva_match)
+
+
+def load_pages(pages_dir):
+    pages = {}
+    for file_name in sorted(os.listdir(pages_dir)):
+        if file_name.endswith((".html", ".htm")):
+            with open(os.path.join(pages_dir, file_name), encoding="utf-8", errors="replace") as f:
+                pages[file_name] = f.read()
+    return pages
+
+
+def time_extractor(extractor, pages, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        for html_text in pages.values():
+            extractor(html_text)
+    elapsed = time.perf_counter() - start
+    return elapsed, (repeat * len(pages)) / elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Micro-benchmark di extract_emails_and_piva")
+    parser.add_argument("--pages", default=PAGES_DIR)
+    parser.add_argument("--repeat", type=int, default=50)
+    args = parser.parse_args()
+
+    pages = load_pages(args.pages)
+    if not pages:
+        sys.exit(f"Nessuna pagina .html in {args.pages}")
+    total_kb = sum(len(p) for p in pages.values()) / 1024
+    print(f"{len(pages)} pagine, {total_kb:.0f} KB, {args.repeat} ripetizioni\n")
+
+    extractors = {
+        "legacy (html.parser)": legacy_extract_emails_and_piva,
+        "lxml": lambda h: extract_emails_and_piva(h, mode="lxml"),
+        "regex": lambda h: extract_emails_and_piva(h, mode="regex"),
+    }
+    # Le email del riferimento che una modalità non trova (es. indirizzi spezzati da tag in linea)
+    # sono regressioni; email in più sono testi che html.parser incollava tra blocchi adiacenti.
+    regressions = 0
+    for name, html_text in pages.items():
+        print(f"{name}:")
+        reference = None
+        for label, extractor in extractors.items():
+            emails, piva = extractor(html_text)
+            reference = reference or (set(emails), bool(piva))
+            missing = sorted(reference[0] - set(emails)) + (["P.IVA"] if reference[1] and not piva else [])
+            regressions += bool(missing)
+            print(f"  {label:<22} {(emails, piva)}" + (f"  <-- mancano {missing}" if missing else ""))
+    print(f"\nEstrazioni con risultati persi rispetto al riferimento: {regressions}\n" if regressions else "")
+
+    baseline = None
+    for label, extractor in extractors.items():
+        elapsed, pages_per_sec = time_extractor(extractor, pages, args.repeat)
+        baseline = baseline or pages_per_sec
+        print(f"{label:<22} {elapsed:7.3f}s  {pages_per_sec:8.1f} pagine/s  x{pages_per_sec / baseline:.1f}")
+
+
+if __name__ == "__main__":
+    main()
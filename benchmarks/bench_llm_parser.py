@@ -0,0 +1,113 @@
+# benchmarks/bench_llm_parser.py
+# Accuratezza e throughput di llm_parser sul corpus benchmarks/fixtures/gemini_outputs
+# (ogni NOME.txt è un output LLM, NOME.json l'elenco atteso di [nome, sito, dominio]).
+# Uso: python benchmarks/bench_llm_parser.py [--fixtures DIR] [--repeat N]
+import argparse
+import json
+import os
+import re
+import sys
+import time
+from urllib.parse import urlparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from llm_parser import parse_company_lines, site_domain
+
+FIXTURES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures", "gemini_outputs")
+
+
+def legacy_parse_company_lines(llm_output):
+    """Parser originale di app.py (quattro re.match non compilati per riga), tenuto qui solo come riferimento."""
+    for line in llm_output.strip().splitlines():
+        line = line.strip()
+        name, site_str = None, None
+        if not line or line.startswith("---") or "<Nome Azienda>" in line or "```" in line or "elenco" in line.lower():
+            continue
+        m_s = re.match(r'\*?\s*(.+?)\s*-\s*(https?://.+)', line)
+        m_sw = re.match(r'\*?\s*(.+?)\s*-\s*(www\..+)', line)
+        match_md_corrected = re.match(r'\*?\s*(.+?)\s*-\s*\[.*?\]\((https?://[^\)]+)\)', line)
+        if match_md_corrected:
+            name, site_str = match_md_corrected.group(1).strip(), match_md_corrected.group(2).strip()
+        elif m_s:
+            name, site_str = m_s.group(1).strip(), m_s.group(2).strip()
+        elif m_sw:
+            name, site_str = m_sw.group(1).strip(), "https://" + m_sw.group(2).strip()
+        elif "-" in line:
+            parts = line.split("-", 1)
+            name = parts[0].replace("*", "").strip()
+            raw_site = parts[1].strip()
+            if re.match(r'^(https?://)?(www\.)?[a-zA-Z0-9\-.]+\.[a-z]{2,}', raw_site, re.I):
+                site_str = "https://" + raw_site if not raw_site.startswith(("http", "https")) else raw_site
+        else:
+            name = line.replace("*", "").strip()
+        if name:
+            domain = urlparse(site_str).netloc.lower().replace("www.", "") if site_str else None
+            yield name, site_str, domain or None
+
+
+def load_fixtures(fixtures_dir):
+    fixtures = {}
+    for file_name in sorted(os.listdir(fixtures_dir)):
+        if not file_name.endswith(".txt"):
+            continue
+        base_name = file_name[:-4]
+        with open(os.path.join(fixtures_dir, file_name), encoding="utf-8") as f:
+            llm_output = f.read()
+        with open(os.path.join(fixtures_dir, base_name + ".json"), encoding="utf-8") as f:
+            expected = [tuple(record) for record in json.load(f)]
+        fixtures[base_name] = (llm_output, expected)
+    return fixtures
+
+
+def score(parser, fixtures):
+    """Confronta (nome, dominio): il sito esatto può variare per uno slash finale senza effetti sulla pipeline."""
+    true_positive, false_positive, false_negative = 0, 0, 0
+    for llm_output, expected in fixtures.values():
+        expected_keys = {(name, domain) for name, _, domain in expected}
+        parsed_keys = {(name, site_domain(site) if site else None) for name, site, _ in parser(llm_output)}
+        true_positive += len(expected_keys & parsed_keys)
+        false_positive += len(parsed_keys - expected_keys)
+        false_negative += len(expected_keys - parsed_keys)
+    precision = true_positive / (true_positive + false_positive) if true_positive + false_positive else 0.0
+    recall = true_positive / (true_positive + false_negative) if true_positive + false_negative else 0.0
+    return precision, recall
+
+
+def time_parser(parser, fixtures, repeat):
+    lines = sum(len(llm_output.splitlines()) for llm_output, _ in fixtures.values())
+    start = time.perf_counter()
+    for _ in range(repeat):
+        for llm_output, _ in fixtures.values():
+            for _record in parser(llm_output):
+                pass
+    elapsed = time.perf_counter() - start
+    return elapsed, (repeat * lines) / elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Accuratezza e throughput del parser degli output LLM")
+    parser.add_argument("--fixtures", default=FIXTURES_DIR)
+    parser.add_argument("--repeat", type=int, default=2000)
+    args = parser.parse_args()
+
+    fixtures = load_fixtures(args.fixtures)
+    if not fixtures:
+        print(f"Nessuna fixture in {args.fixtures}")
+        return
+    print(f"{len(fixtures)} output LLM, {sum(len(e) for _, e in fixtures.values())} aziende attese\n")
+
+    results = {}
+    for label, parse_fn in (("legacy (re.match)", legacy_parse_company_lines), ("llm_parser", parse_company_lines)):
+        precision, recall = score(parse_fn, fixtures)
+        elapsed, lines_per_sec = time_parser(parse_fn, fixtures, args.repeat)
+        results[label] = lines_per_sec
+        print(f"{label:<20} precisione {precision:6.1%}  richiamo {recall:6.1%}  "
+              f"{elapsed:7.3f}s  {lines_per_sec:10.0f} righe/s")
+
+    speedup = results["llm_parser"] / results["legacy (re.match)"]
+    print(f"\nSpeedup: {speedup:.2f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,91 @@
+# benchmarks/bench_parse_pool.py
+# Scalabilità del parsing (extract_emails_and_piva + rank_contact_links) con il numero di processi di
+# ParsePool, chiamato da un event loop come fa AsyncFetchEngine. Per ogni configurazione riporta pagine/s,
+# speedup rispetto al parsing nel loop e il ritardo massimo accumulato dall'event loop (che nel motore
+# vero rallenterebbe tutte le richieste in volo).
+# Uso: python benchmarks/bench_parse_pool.py [--pages N] [--workers 1,2,4] [--min-chars C]
+import argparse
+import asyncio
+import os
+import sys
+import time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCH_DIR))
+sys.path.insert(0, BENCH_DIR)
+
+from parse_pool import ParsePool, analyze_page, MAX_PARSE_WORKERS
+from bench_extraction import load_pages, PAGES_DIR
+
+LOOP_TICK_SECONDS = 0.01
+
+
+def default_worker_counts():
+    counts, workers = [], 1
+    while workers < MAX_PARSE_WORKERS:
+        counts.append(workers)
+        workers *= 2
+    return counts + [MAX_PARSE_WORKERS]
+
+
+async def _loop_lag_probe(stop_event, lags):
+    # Un timer da 10ms: quanto arriva in ritardo misura per quanto l'event loop è rimasto bloccato.
+    while not stop_event.is_set():
+        expected = time.perf_counter() + LOOP_TICK_SECONDS
+        await asyncio.sleep(LOOP_TICK_SECONDS)
+        lags.append(max(0.0, time.perf_counter() - expected))
+
+
+async def _parse_all(pages, parse_pool):
+    stop_event, lags = asyncio.Event(), []
+    probe = asyncio.create_task(_loop_lag_probe(stop_event, lags))
+
+    async def parse_one(html_text):
+        if parse_pool is None:
+            analyze_page(html_text, "https://www.esempio.it/", 3)
+            await asyncio.sleep(0)  # Come nel motore: il parsing nel loop cede il controllo solo tra una pagina e l'altra.
+        else:
+            await parse_pool.analyze(html_text, "https://www.esempio.it/", 3)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(parse_one(html_text) for html_text in pages))
+    elapsed = time.perf_counter() - start
+    stop_event.set()
+    await probe
+    return elapsed, max(lags, default=0.0)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Scalabilità del parsing con ParsePool")
+    parser.add_argument("--pages-dir", default=PAGES_DIR)
+    parser.add_argument("--pages", type=int, default=400, help="pagine analizzate per configurazione")
+    parser.add_argument("--workers", default=None, help="numeri di processi separati da virgola (default 1,2,4..core)")
+    parser.add_argument("--min-chars", type=int, default=0, help="soglia sotto cui la pagina resta nel loop")
+    args = parser.parse_args()
+
+    source_pages = list(load_pages(args.pages_dir).values())
+    if not source_pages:
+        sys.exit(f"Nessuna pagina .html in {args.pages_dir}")
+    pages = [source_pages[i % len(source_pages)] for i in range(args.pages)]
+    worker_counts = [int(w) for w in args.workers.split(",")] if args.workers else default_worker_counts()
+    print(f"{len(pages)} pagine ({sum(len(p) for p in pages) / 1024 / 1024:.1f} MB), {MAX_PARSE_WORKERS} core\n")
+
+    baseline_elapsed, baseline_lag = asyncio.run(_parse_all(pages, None))
+    baseline = len(pages) / baseline_elapsed
+    print(f"{'nel loop':<14} {baseline_elapsed:7.2f}s  {baseline:8.1f} pagine/s  x{1.0:<5.1f} "
+          f"ritardo loop max {baseline_lag * 1000:7.1f}ms")
+    for workers in worker_counts:
+        parse_pool = ParsePool(workers, min_chars=args.min_chars)
+        try:
+            # Primo giro di riscaldamento: l'avvio dei processi (spawn + import) non va nella misura.
+            asyncio.run(_parse_all(pages[:workers * 2], parse_pool))
+            elapsed, lag = asyncio.run(_parse_all(pages, parse_pool))
+        finally:
+            parse_pool.close()
+        pages_per_sec = len(pages) / elapsed
+        print(f"{f'{workers} processi':<14} {elapsed:7.2f}s  {pages_per_sec:8.1f} pagine/s  x{pages_per_sec / baseline:<5.1f} "
+              f"ritardo loop max {lag * 1000:7.1f}ms")
+
+
+if __name__ == "__main__":
+    main()
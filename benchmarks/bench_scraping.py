@@ -0,0 +1,197 @@
+# benchmarks/bench_scraping.py
+# Benchmark offline dello scraping sul corpus di siti in benchmarks/corpus, senza rete.
+# - estrazione: extract_emails_and_piva + rank_contact_links su ogni pagina HTML del corpus;
+# - crawl: extract_emails_from_url (thread, come il vecchio percorso) ed extract_emails_from_url_async
+#   (AsyncFetchEngine) contro replay_server, con latenza ed errori iniettati.
+# Per ogni livello: pagine/s, aziende/s, latenza p50/p95 e picco di memoria (tracemalloc).
+# Uso: python benchmarks/bench_scraping.py [--layer all|extraction|crawl] [--mode all|async|sync] [--copies N]
+#      [--parse-workers N] [--fixed-limits] [--capacity N] [--latency MS] [--jitter MS] [--rate-404 R]
+#      [--rate-5xx R] [--rate-timeout R] [--timeout S]
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCH_DIR))
+sys.path.insert(0, BENCH_DIR)
+
+from contact_discovery import rank_contact_links
+from domain_health import DomainHealthRegistry
+from extraction import extract_emails_and_piva
+from response_limits import declared_charset
+from replay_server import ReplayServer, FaultProfile, load_corpus, CORPUS_DIR
+import scraping
+
+
+def percentile(values, fraction):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(fraction * (len(ordered) - 1))))]
+
+
+def report(label, elapsed, pages, companies, latencies, peak_bytes):
+    print(f"{label:<16} {elapsed:7.2f}s  {pages / elapsed:8.1f} pagine/s  {companies / elapsed:7.1f} aziende/s  "
+          f"p50 {percentile(latencies, 0.5) * 1000:7.1f}ms  p95 {percentile(latencies, 0.95) * 1000:7.1f}ms  "
+          f"picco {peak_bytes / 1024 / 1024:6.1f}MB")
+
+
+def html_pages(corpus):
+    """{sito: [(url, testo)]} con le sole pagine HTML, decodificate con il charset dichiarato."""
+    pages = {}
+    for site_name, site_pages in corpus.items():
+        pages[site_name] = [(f"https://{site_name}.it{path}", body.decode(declared_charset(content_type, body), "replace"))
+                            for path, (content_type, body) in site_pages.items()
+                            if content_type == "text/html" and path.endswith(".html")]
+    return pages
+
+
+def measure(run):
+    """
+    Esegue run() due volte: la prima per i tempi, la seconda sotto tracemalloc per il picco di memoria
+    (tracemalloc rallenta molto il codice Python e falserebbe le latenze).
+    """
+    start = time.perf_counter()
+    result = run()
+    elapsed = time.perf_counter() - start
+    tracemalloc.start()
+    run()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return elapsed, result, peak
+
+
+def bench_extraction(corpus, repeat):
+    pages = html_pages(corpus)
+
+    def run():
+        latencies = []
+        for _ in range(repeat):
+            for site_pages in pages.values():
+                for url, html_text in site_pages:
+                    page_start = time.perf_counter()
+                    extract_emails_and_piva(html_text, url)
+                    rank_contact_links(html_text, url)
+                    latencies.append(time.perf_counter() - page_start)
+        return latencies
+
+    elapsed, latencies, peak = measure(run)
+    report("estrazione", elapsed, len(latencies), repeat * len(pages), latencies, peak)
+
+
+def crawl_sync(sites, domain_health, workers):
+    def timed(base_url):
+        started = time.perf_counter()
+        result = scraping.extract_emails_from_url(base_url, domain_health)
+        return time.perf_counter() - started, result
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        return list(executor.map(timed, [base_url for _, base_url in sites]))
+
+
+def crawl_async(sites, domain_health, timeout, parse_workers, adaptive):
+    engine = scraping.create_fetch_engine(timeout=timeout, parse_workers=parse_workers, adaptive=adaptive)
+
+    async def timed(base_url):
+        started = time.perf_counter()
+        result = await scraping.extract_emails_from_url_async(base_url, domain_health, engine)
+        return time.perf_counter() - started, result
+
+    try:
+        futures = [engine.submit(timed(base_url)) for _, base_url in sites]
+        results = [future.result() for future in futures]
+        concurrency = engine.concurrency_stats()
+        print(f"{'':<16} concorrenza {concurrency['globale']}, host rallentati {len(concurrency['host_rallentati'])}")
+        return results
+    finally:
+        engine.close()
+
+
+def accuracy(sites, results, expected):
+    wanted_emails = found_emails = wanted_piva = found_piva = 0
+    for (site_name, _), (_, (emails, has_piva, _)) in zip(sites, results):
+        wanted = expected.get(site_name, {})
+        # Al massimo MAX_EMAILS_PER_COMPANY email per azienda: oltre non possono essere trovate.
+        wanted_emails += min(len(wanted.get("emails", [])), scraping.MAX_EMAILS_PER_COMPANY)
+        found_emails += len(set(emails) & set(wanted.get("emails", [])))
+        wanted_piva += bool(wanted.get("piva"))
+        found_piva += bool(wanted.get("piva")) and bool(has_piva)
+    return f"email attese trovate {found_emails}/{wanted_emails}, P.IVA {found_piva}/{wanted_piva}"
+
+
+def bench_crawl(server, expected, modes, workers, timeout, parse_workers, adaptive, work_dir):
+    for mode in modes:
+        def run():
+            # Cache HTTP vuota e registro domini nuovo a ogni giro: si misura la rete, non la cache.
+            scraping.get_http_cache().clear()
+            domain_health = DomainHealthRegistry(path=os.path.join(work_dir, f"domain_health_{mode}.json"))
+            server.reset_stats()
+            if mode == "async":
+                return crawl_async(server.sites, domain_health, timeout, parse_workers, adaptive), server.stats()
+            return crawl_sync(server.sites, domain_health, workers), server.stats()
+
+        elapsed, (results, served), peak = measure(run)
+        report(f"crawl {mode}", elapsed, served["totale"], len(results), [latency for latency, _ in results], peak)
+        print(f"{'':<16} richieste {served}; {accuracy(server.sites, results, expected)}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark offline di estrazione e crawl")
+    parser.add_argument("--corpus", default=CORPUS_DIR)
+    parser.add_argument("--layer", choices=("all", "extraction", "crawl"), default="all")
+    parser.add_argument("--mode", choices=("all", "async", "sync"), default="all", help="percorso di crawl")
+    parser.add_argument("--repeat", type=int, default=20, help="ripetizioni del livello estrazione")
+    parser.add_argument("--copies", type=int, default=5, help="copie del corpus, ognuna su porte diverse")
+    parser.add_argument("--workers", type=int, default=8, help="thread del crawl sincrono")
+    parser.add_argument("--timeout", type=float, default=2.0,
+                        help="timeout del motore asincrono (s); il percorso sincrono usa quello di get_with_retries")
+    parser.add_argument("--parse-workers", type=int, default=0,
+                        help="processi di ParsePool per il crawl asincrono (0 = parsing nel loop)")
+    parser.add_argument("--fixed-limits", action="store_true",
+                        help="limiti di concorrenza fissi invece che adattivi nel crawl asincrono")
+    parser.add_argument("--capacity", type=int, default=0,
+                        help="richieste contemporanee servite dal server (0 = illimitate); le altre vanno in timeout")
+    parser.add_argument("--latency", type=float, default=30.0, help="latenza media per richiesta (ms)")
+    parser.add_argument("--jitter", type=float, default=10.0, help="variazione massima della latenza (ms)")
+    parser.add_argument("--rate-404", type=float, default=0.05)
+    parser.add_argument("--rate-5xx", type=float, default=0.05)
+    parser.add_argument("--rate-timeout", type=float, default=0.0)
+    parser.add_argument("--hang", type=float, default=10.0, help="durata delle richieste in timeout (s)")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    corpus_dir = os.path.abspath(args.corpus)
+    with open(os.path.join(corpus_dir, "expected.json"), encoding="utf-8") as f:
+        expected = json.load(f)
+    corpus = load_corpus(corpus_dir)
+    print(f"{len(corpus)} siti nel corpus, {sum(len(p) for p in html_pages(corpus).values())} pagine HTML\n")
+
+    if args.layer in ("all", "extraction"):
+        bench_extraction(corpus, args.repeat)
+
+    if args.layer in ("all", "crawl"):
+        faults = FaultProfile(args.latency / 1000, args.jitter / 1000, args.rate_404, args.rate_5xx,
+                              args.rate_timeout, args.hang, args.seed, args.capacity)
+        server = ReplayServer(corpus_dir, args.copies, faults).start()
+        modes = ("sync", "async") if args.mode == "all" else (args.mode,)
+        print(f"\n{len(server.sites)} siti serviti, latenza {args.latency:.0f}±{args.jitter:.0f}ms, "
+              f"404 {args.rate_404:.0%}, 5xx {args.rate_5xx:.0%}, timeout {args.rate_timeout:.0%}\n")
+        # Cache e registro domini in una cartella temporanea, per non toccare quelli dell'app.
+        with tempfile.TemporaryDirectory() as work_dir:
+            previous_dir = os.getcwd()
+            os.chdir(work_dir)
+            try:
+                bench_crawl(server, expected, modes, args.workers, args.timeout, args.parse_workers,
+                            not args.fixed_limits, work_dir)
+            finally:
+                os.chdir(previous_dir)
+                server.stop()
+
+
+if __name__ == "__main__":
+    main()
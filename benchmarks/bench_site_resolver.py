@@ -0,0 +1,58 @@
+# benchmarks/bench_site_resolver.py
+# Confronto tra la risoluzione sequenziale nome -> sito (una ricerca alla volta, come il vecchio
+# find_site_by_name) e SiteResolver, usando StaticSearchBackend con latenza simulata al posto di Google.
+# Uso: python benchmarks/bench_site_resolver.py [--names N] [--latency S] [--rate R]
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from site_resolver import SiteResolver, StaticSearchBackend, pick_official_site
+
+
+def build_backend(num_names, latency):
+    results = {}
+    for i in range(num_names):
+        query = f"Azienda Prova {i} sito ufficiale"
+        # Un nome su cinque non ha un sito: verifica anche la cache dei risultati negativi.
+        results[query] = [] if i % 5 == 0 else [f"https://www.facebook.com/azienda{i}", f"https://www.azienda{i}.it/"]
+    return StaticSearchBackend(results, latency=latency)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark della risoluzione nome -> sito")
+    parser.add_argument("--names", type=int, default=20)
+    parser.add_argument("--latency", type=float, default=0.5, help="latenza simulata per ricerca (s)")
+    parser.add_argument("--rate", type=float, default=4.0, help="ricerche al secondo concesse al resolver")
+    args = parser.parse_args()
+
+    names = [f"Azienda Prova {i}" for i in range(args.names)]
+    backend = build_backend(args.names, args.latency)
+
+    start = time.perf_counter()
+    sequential = {name: pick_official_site(backend.search(f"{name} sito ufficiale")) for name in names}
+    sequential_elapsed = time.perf_counter() - start
+
+    with tempfile.TemporaryDirectory() as cache_dir:
+        resolver = SiteResolver(backend=backend, directory=cache_dir, rate=args.rate, burst=args.rate)
+        start = time.perf_counter()
+        cold = resolver.resolve_many(names, log_func=lambda message: None)
+        cold_elapsed = time.perf_counter() - start
+        start = time.perf_counter()
+        warm = resolver.resolve_many(names, log_func=lambda message: None)
+        warm_elapsed = time.perf_counter() - start
+        stats = resolver.stats()
+
+    assert cold == sequential == warm, "risultati diversi tra le strategie"
+    print(f"{args.names} nomi, latenza {args.latency}s, limite {args.rate} ricerche/s\n")
+    print(f"{'sequenziale':<22} {sequential_elapsed:7.2f}s")
+    print(f"{'resolver (cache vuota)':<22} {cold_elapsed:7.2f}s  speedup {sequential_elapsed / cold_elapsed:.1f}x")
+    print(f"{'resolver (cache piena)':<22} {warm_elapsed:7.3f}s")
+    print(f"\nStatistiche: {stats}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,221 @@
+# benchmarks/replay_server.py
+# Server HTTP locale che riproduce il corpus di siti in benchmarks/corpus, uno per porta (così ogni sito
+# ha un netloc distinto, come domini diversi), con latenza, 404, 5xx e timeout iniettati.
+# Uso autonomo: python benchmarks/replay_server.py [--copies N] [--latency MS] [--rate-5xx 0.05] ...
+import argparse
+import hashlib
+import os
+import random
+import threading
+import time
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+CORPUS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "corpus")
+CONTENT_TYPES = {
+    ".html": "text/html",
+    ".xml": "application/xml",
+    ".pdf": "application/pdf",
+    ".txt": "text/plain",
+}
+OK, NOT_FOUND, SERVER_ERROR, TIMEOUT = "ok", "404", "5xx", "timeout"
+
+
+class FaultProfile:
+    """
+    Guasti da iniettare. La decisione dipende solo da (seed, sito, percorso): lo stesso URL fallisce sempre
+    allo stesso modo, quindi due esecuzioni con lo stesso seed sono confrontabili. La latenza invece è
+    casuale per richiesta (latency ± jitter, in secondi). Con capacity > 0 il server simula un unico IP
+    condiviso da tutti i siti: oltre capacity richieste contemporanee quelle in eccesso non ricevono risposta.
+    """
+
+    def __init__(self, latency=0.0, jitter=0.0, rate_404=0.0, rate_5xx=0.0, rate_timeout=0.0, hang=10.0, seed=0,
+                 capacity=0):
+        self.latency = latency
+        self.jitter = jitter
+        self.rate_404 = rate_404
+        self.rate_5xx = rate_5xx
+        self.rate_timeout = rate_timeout
+        self.hang = hang
+        self.seed = seed
+        self.capacity = capacity
+
+    def outcome(self, site, path):
+        digest = hashlib.sha1(f"{self.seed}:{site}:{path}".encode()).digest()
+        draw = int.from_bytes(digest[:8], "big") / 2 ** 64
+        for outcome, rate in ((TIMEOUT, self.rate_timeout), (SERVER_ERROR, self.rate_5xx), (NOT_FOUND, self.rate_404)):
+            if draw < rate:
+                return outcome
+            draw -= rate
+        return OK
+
+    def delay(self):
+        return max(0.0, self.latency + random.uniform(-self.jitter, self.jitter))
+
+
+def load_site(site_dir):
+    """{percorso URL: (content-type, byte)}; index.html risponde a "/", le pagine .html anche senza estensione."""
+    pages = {}
+    for root, _, files in os.walk(site_dir):
+        for file_name in files:
+            full_path = os.path.join(root, file_name)
+            rel_path = "/" + os.path.relpath(full_path, site_dir).replace(os.sep, "/")
+            extension = os.path.splitext(file_name)[1].lower()
+            content_type = CONTENT_TYPES.get(extension, "application/octet-stream")
+            with open(full_path, "rb") as f:
+                body = f.read()
+            # Nessun charset nell'header: vale quello del <meta>, come su molti siti reali.
+            pages[rel_path] = (content_type, body)
+            if extension == ".html":
+                url_path = rel_path[:-len(".html")]
+                pages[url_path[:-len("index")] if url_path.endswith("/index") else url_path] = (content_type, body)
+    return pages
+
+
+def load_corpus(corpus_dir=CORPUS_DIR):
+    return {name: load_site(os.path.join(corpus_dir, name)) for name in sorted(os.listdir(corpus_dir))
+            if os.path.isdir(os.path.join(corpus_dir, name))}
+
+
+class ReplayServer:
+    """
+    Avvia un listener su 127.0.0.1 per ogni sito del corpus (ripetuto copies volte, ogni copia su una
+    porta diversa) e conta le richieste servite per esito.
+    """
+
+    def __init__(self, corpus_dir=CORPUS_DIR, copies=1, faults=None):
+        self.corpus = load_corpus(corpus_dir)
+        self.copies = copies
+        self.faults = faults or FaultProfile()
+        self.sites = []  # [(nome sito, base URL)]
+        self._servers = []
+        self._stats_lock = threading.Lock()
+        self._active = 0
+        self.reset_stats()
+
+    def reset_stats(self):
+        with self._stats_lock:
+            self.counts = {OK: 0, NOT_FOUND: 0, SERVER_ERROR: 0, TIMEOUT: 0}
+            self.peak_active = 0
+
+    def _enter(self):
+        """Registra una richiesta in corso; False se supera la capacità simulata del server."""
+        with self._stats_lock:
+            self._active += 1
+            self.peak_active = max(self.peak_active, self._active)
+            return not self.faults.capacity or self._active <= self.faults.capacity
+
+    def _leave(self):
+        with self._stats_lock:
+            self._active -= 1
+
+    def stats(self):
+        with self._stats_lock:
+            return dict(self.counts, totale=sum(self.counts.values()), picco_concorrenti=self.peak_active)
+
+    def _count(self, outcome):
+        with self._stats_lock:
+            self.counts[outcome] += 1
+
+    def _handler(self, site_name, pages):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, *args):
+                pass
+
+            def _send(self, status, content_type, body):
+                self.send_response(status)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def do_GET(self):
+                try:
+                    self._serve(server._enter())
+                finally:
+                    server._leave()
+
+            def _serve(self, within_capacity):
+                path = self.path.split("?", 1)[0].split("#", 1)[0]
+                outcome = server.faults.outcome(site_name, path) if within_capacity else TIMEOUT
+                time.sleep(server.faults.delay())
+                if outcome == TIMEOUT:
+                    # Non risponde finché il client non rinuncia (hang deve superare il timeout del client).
+                    server._count(TIMEOUT)
+                    time.sleep(server.faults.hang)
+                    self.close_connection = True
+                    return
+                if outcome == SERVER_ERROR:
+                    server._count(SERVER_ERROR)
+                    self._send(503, "text/html", b"<h1>Service Unavailable</h1>")
+                    return
+                page = pages.get(path) or pages.get(path.rstrip("/"))
+                if outcome == NOT_FOUND or page is None:
+                    server._count(NOT_FOUND)
+                    self._send(404, "text/html", b"<h1>Pagina non trovata</h1>")
+                    return
+                content_type, body = page
+                if content_type == "application/xml":
+                    # Le sitemap usano {base} al posto dell'host, che qui cambia a ogni avvio.
+                    body = body.replace(b"{base}", f"http://{self.headers.get('Host')}".encode())
+                server._count(OK)
+                self._send(200, content_type, body)
+
+            def handle_one_request(self):
+                try:
+                    super().handle_one_request()
+                except (BrokenPipeError, ConnectionResetError):
+                    self.close_connection = True
+
+        return Handler
+
+    def start(self):
+        for copy in range(self.copies):
+            for site_name, pages in self.corpus.items():
+                httpd = ThreadingHTTPServer(("127.0.0.1", 0), self._handler(site_name, pages))
+                httpd.daemon_threads = True
+                threading.Thread(target=httpd.serve_forever, daemon=True).start()
+                self._servers.append(httpd)
+                self.sites.append((site_name, f"http://127.0.0.1:{httpd.server_port}/"))
+        return self
+
+    def stop(self):
+        for httpd in self._servers:
+            httpd.shutdown()
+            httpd.server_close()
+        self._servers, self.sites = [], []
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Server di replay del corpus di siti per i benchmark")
+    parser.add_argument("--corpus", default=CORPUS_DIR)
+    parser.add_argument("--copies", type=int, default=1)
+    parser.add_argument("--latency", type=float, default=0.0, help="latenza media per richiesta (ms)")
+    parser.add_argument("--jitter", type=float, default=0.0, help="variazione massima della latenza (ms)")
+    parser.add_argument("--rate-404", type=float, default=0.0)
+    parser.add_argument("--rate-5xx", type=float, default=0.0)
+    parser.add_argument("--rate-timeout", type=float, default=0.0)
+    parser.add_argument("--hang", type=float, default=10.0, help="durata delle richieste in timeout (s)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--capacity", type=int, default=0, help="richieste contemporanee servite (0 = illimitate)")
+    args = parser.parse_args()
+
+    faults = FaultProfile(args.latency / 1000, args.jitter / 1000, args.rate_404, args.rate_5xx, args.rate_timeout,
+                          args.hang, args.seed, args.capacity)
+    server = ReplayServer(args.corpus, args.copies, faults).start()
+    for site_name, base_url in server.sites:
+        print(f"{site_name:<30} {base_url}")
+    print("\nCtrl+C per fermare.")
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        print(f"\nRichieste servite: {server.stats()}")
+        server.stop()
+
+
+if __name__ == "__main__":
+    main()
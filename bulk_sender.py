@@ -0,0 +1,176 @@
+# bulk_sender.py
+import random
+import socket
+import threading
+import time
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from rate_limit import TokenBucket
+from gmail_config import get_gmail_credentials, build_gmail_service
+from lead_store import get_lead_store
+from metrics import get_metrics, STAGE_EMAIL_SEND
+
+# messages.send costa 100 unità di quota e la quota per utente è 250 unità/s: oltre 2 invii al secondo
+# Gmail risponde 429. Il limite giornaliero è di 500 destinatari per account gmail.com (2000 con Workspace):
+# Gmail lo calcola sulle ultime 24 ore, qui si contano gli invii per giorno di calendario.
+GMAIL_SENDS_PER_SECOND = 2.0
+GMAIL_SEND_BURST = 4
+GMAIL_DAILY_SEND_LIMIT = 500
+SEND_WORKERS = 4  # Basta a tenere pieno il bucket anche con la registrazione sul server di tracciamento.
+SEND_MAX_ATTEMPTS = 4
+SEND_BACKOFF_SECONDS = 2.0
+SEND_MAX_BACKOFF_SECONDS = 60.0  # Un Retry-After più lungo vuol dire quota esaurita: inutile aspettare.
+RETRYABLE_SEND_STATUS = (429, 500, 502, 503, 504)
+RATE_LIMIT_REASONS = ("rateLimitExceeded", "userRateLimitExceeded")
+
+SendJob = namedtuple("SendJob", ["company_name", "email", "site"])
+SendResult = namedtuple("SendResult", ["job", "success", "status", "attempts"])
+
+
+def _http_status(error):
+    """Codice HTTP di un googleapiclient.errors.HttpError, None per gli altri errori."""
+    resp = getattr(error, "resp", None)
+    return getattr(resp, "status", None)
+
+
+def _retry_after(error):
+    resp = getattr(error, "resp", None)
+    try:
+        return float(resp.get("retry-after")) if resp is not None and resp.get("retry-after") else None
+    except (TypeError, ValueError):
+        return None
+
+
+def is_retryable_send_error(error):
+    """429, 5xx e i 403 di rate limit di Gmail si riprovano; errori di rete anche (socket, timeout)."""
+    status = _http_status(error)
+    if status is None:
+        return isinstance(error, (socket.timeout, ConnectionError, TimeoutError))
+    if status in RETRYABLE_SEND_STATUS:
+        return True
+    return status == 403 and any(reason in str(error) for reason in RATE_LIMIT_REASONS)
+
+
+class BulkSender:
+    """
+    Invio in blocco via Gmail API: un pool limitato di thread, ognuno con il proprio servizio Gmail
+    (httplib2 non è thread-safe), e un unico token bucket tarato sulla quota di invio. 429 e 5xx vengono
+    riprovati con backoff esponenziale (o il Retry-After di Gmail), riprendendo ogni volta un gettone dal
+    bucket; un rate limit mette in pausa tutti i thread, non solo quello che l'ha ricevuto.
+    send_all() è un generatore di SendResult nell'ordine in cui gli invii terminano.
+    Ogni invio prenota un posto nel conteggio giornaliero di send_log (l'archivio lead, condiviso tra
+    sessioni): raggiunto daily_limit gli invii successivi della giornata non partono.
+    """
+
+    def __init__(self, email_sender, credentials=None, workers=SEND_WORKERS, rate=GMAIL_SENDS_PER_SECOND,
+                 burst=GMAIL_SEND_BURST, daily_limit=GMAIL_DAILY_SEND_LIMIT, send_log=None, service_factory=None):
+        self.email_sender = email_sender  # Costruisce i messaggi e registra il tracciamento (EmailSender).
+        self.workers = workers
+        self.daily_limit = daily_limit
+        self.send_log = send_log or get_lead_store()
+        # Le credenziali si ottengono qui, nel thread chiamante: l'eventuale login nel browser non
+        # deve partire da un worker. service_factory sostituisce build_gmail_service (test, benchmark).
+        if service_factory is None:
+            creds = credentials or get_gmail_credentials()
+            service_factory = lambda: build_gmail_service(creds)
+        self._service_factory = service_factory
+        self._bucket = TokenBucket(rate, burst)
+        self._local = threading.local()
+        self._pause_lock = threading.Lock()
+        self._paused_until = 0.0
+        self._stop_event = threading.Event()
+
+    def stop(self):
+        """Gli invii non ancora partiti terminano con esito "non inviata"."""
+        self._stop_event.set()
+
+    def _service(self):
+        service = getattr(self._local, "service", None)
+        if service is None:
+            service = self._local.service = self._service_factory()
+        return service
+
+    def _pause_all(self, seconds):
+        with self._pause_lock:
+            self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+
+    def _wait_for_slot(self):
+        while True:
+            with self._pause_lock:
+                remaining = self._paused_until - time.monotonic()
+            if remaining <= 0:
+                break
+            time.sleep(remaining)
+        self._bucket.acquire()
+
+    def _send_one(self, job, subject, message_template):
+        if self._stop_event.is_set():
+            return SendResult(job, False, "Non inviata: invio interrotto.", 0)
+        day = self.send_log.reserve_daily_send(self.daily_limit)
+        if day is None:
+            return SendResult(job, False, f"Non inviata: raggiunto il limite di {self.daily_limit} invii al giorno.", 0)
+        result = None
+        try:
+            result = self._send_reserved(job, subject, message_template)
+            return result
+        finally:
+            if result is None or not result.success:
+                self.send_log.release_daily_send(day)  # Messaggio non partito: il posto torna libero.
+
+    def _send_reserved(self, job, subject, message_template):
+        metrics = get_metrics()
+        try:
+            # Tracciamento registrato una sola volta: i retry rimandano lo stesso messaggio.
+            raw_message, tracking_id = self.email_sender.build_raw_message(job.email, subject, message_template,
+                                                                           job.company_name)
+        except Exception as e:
+            metrics.inc("email_errori")
+            return SendResult(job, False, f"Errore nella preparazione: {e}", 0)
+
+        for attempt in range(1, SEND_MAX_ATTEMPTS + 1):
+            self._wait_for_slot()
+            if self._stop_event.is_set():
+                return SendResult(job, False, "Non inviata: invio interrotto.", attempt - 1)
+            try:
+                with metrics.timer(STAGE_EMAIL_SEND):
+                    result = self._service().users().messages().send(userId="me",
+                                                                     body={"raw": raw_message}).execute()
+                metrics.inc("email_inviate")
+                status = f"Inviata (ID: {result['id']})"
+                if tracking_id is None:
+                    status += ", senza tracciamento"
+                return SendResult(job, True, status, attempt)
+            except Exception as e:
+                if not is_retryable_send_error(e) or attempt == SEND_MAX_ATTEMPTS:
+                    metrics.inc("email_errori")
+                    return SendResult(job, False, f"Errore: {e}", attempt)
+                retry_after = _retry_after(e)
+                if retry_after is not None and retry_after > SEND_MAX_BACKOFF_SECONDS:
+                    # Quota giornaliera esaurita: inutile continuare, i messaggi restanti non partono.
+                    metrics.inc("email_errori")
+                    self.stop()
+                    return SendResult(job, False, f"Quota Gmail esaurita (riprova tra {retry_after / 60:.0f} min).",
+                                      attempt)
+                metrics.inc("email_retry")
+                delay = retry_after or min(SEND_MAX_BACKOFF_SECONDS,
+                                           SEND_BACKOFF_SECONDS * 2 ** (attempt - 1) * random.uniform(0.5, 1.5))
+                if _http_status(e) in (403, 429):
+                    self._pause_all(delay)  # Rate limit dell'account: vale per tutti i thread.
+                else:
+                    time.sleep(delay)
+
+    def send_all(self, jobs, subject, message_template):
+        """Invia a tutti i destinatari di jobs (SendJob); oltre il limite giornaliero non parte nulla."""
+        jobs = list(jobs)
+        self._stop_event.clear()
+        executor = ThreadPoolExecutor(max_workers=max(1, min(self.workers, len(jobs))),
+                                      thread_name_prefix="gmail-send")
+        try:
+            futures = [executor.submit(self._send_one, job, subject, message_template) for job in jobs]
+            for future in as_completed(futures):
+                yield future.result()
+        finally:
+            # Generatore chiuso prima della fine (es. pagina ricaricata): i job non partiti vengono annullati.
+            self.stop()
+            executor.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,101 @@
+# cli.py
+# Esecuzione della ricerca senza browser (cron, batch, profiling).
+# Uso: python cli.py --settore IA --regione Marche [--max-results 10] [--output utili.jsonl] [--scarti scarti.jsonl]
+#      python cli.py --resume RUN_ID [--output utili.jsonl]
+#      --metrics metriche.json (o .prom per il formato testo di Prometheus) salva le metriche per fase a fine ricerca.
+import argparse
+import json
+import sys
+import time
+
+from pipeline import SearchPipeline, LLM_MODELS, DEFAULT_LLM_MODELS, MAX_LLM_ITERATIONS, RESULT_FIELDS
+from scraping import create_fetch_engine
+
+
+def _log_to_stderr(message):
+    print(f"- {time.strftime('%H:%M:%S')}: {message}", file=sys.stderr, flush=True)
+
+
+def _write_record(stream, record):
+    stream.write(json.dumps({field: record.get(field) for field in RESULT_FIELDS}, ensure_ascii=False) + "\n")
+    stream.flush()
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Trova Clienti da riga di comando: risultati in JSONL")
+    parser.add_argument("--settore")
+    parser.add_argument("--regione")
+    parser.add_argument("--dimensione", type=int, default=20, help="numero massimo di dipendenti")
+    parser.add_argument("--max-results", type=int, default=10, help="risultati utili desiderati")
+    parser.add_argument("--model", action="append", choices=list(LLM_MODELS), dest="models",
+                        help=f"modello LLM (ripetibile, default: {', '.join(DEFAULT_LLM_MODELS)})")
+    parser.add_argument("--max-llm-iterations", type=int, default=MAX_LLM_ITERATIONS)
+    parser.add_argument("--no-llm-cache", action="store_true", help="non riusare le risposte LLM in cache")
+    parser.add_argument("--include-known", action="store_true",
+                        help="visita anche le aziende già trovate nelle ricerche precedenti")
+    parser.add_argument("--output", default="-", help="file JSONL dei risultati utili ('-' = stdout)")
+    parser.add_argument("--scarti", help="file JSONL dei risultati scartati (se omesso non vengono scritti)")
+    parser.add_argument("--resume", metavar="RUN_ID", help="riprende una ricerca interrotta con i suoi parametri")
+    parser.add_argument("--parse-workers", type=int, default=0,
+                        help="processi per il parsing delle pagine (0 = nel thread del motore di fetch)")
+    parser.add_argument("--metrics", metavar="FILE", help="salva le metriche (JSON, o Prometheus se FILE termina in .prom)")
+    args = parser.parse_args(argv)
+    if not args.resume and not (args.settore and args.regione):
+        parser.error("--settore e --regione sono obbligatori se non si usa --resume")
+    return args
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    # Senza processi di parsing la pipeline crea e chiude da sola il proprio motore.
+    engine = create_fetch_engine(parse_workers=args.parse_workers) if args.parse_workers > 0 else None
+    if args.resume:
+        search_pipeline = SearchPipeline.from_checkpoint(args.resume, log_func=_log_to_stderr, engine=engine,
+                                                         max_llm_iterations=args.max_llm_iterations)
+        if search_pipeline is None:
+            _log_to_stderr(f"Ricerca {args.resume} non trovata.")
+            if engine: engine.close()
+            return 2
+    else:
+        search_pipeline = SearchPipeline(args.settore, args.regione, args.dimensione, args.max_results,
+                                         models=args.models, use_llm_cache=not args.no_llm_cache,
+                                         log_func=_log_to_stderr, max_llm_iterations=args.max_llm_iterations,
+                                         skip_known_leads=not args.include_known, engine=engine)
+    utili_stream = sys.stdout if args.output == "-" else open(args.output, "w", encoding="utf-8")
+    scarti_stream = open(args.scarti, "w", encoding="utf-8") if args.scarti else None
+    _log_to_stderr(f"Avvio ricerca {search_pipeline.run_id}: {search_pipeline.settore}, {search_pipeline.regione}...")
+    try:
+        for event in search_pipeline.run():
+            if event.kind in ("result", "restored"):
+                if event.useful:
+                    _write_record(utili_stream, event.record)
+                elif scarti_stream:
+                    _write_record(scarti_stream, event.record)
+            elif event.kind == "batch":
+                _log_to_stderr(f"Batch LLM {event.iteration}: {event.count} aziende nuove.")
+            elif event.kind == "batch_end":
+                _log_to_stderr(f"Batch {event.iteration} concluso. Utili: {event.count}/{search_pipeline.max_results}")
+    except KeyboardInterrupt:
+        _log_to_stderr(f"Interrotto dall'utente. Per riprendere: python cli.py --resume {search_pipeline.run_id}")
+    finally:
+        search_pipeline.stop()
+        if engine:
+            engine.close()
+        if utili_stream is not sys.stdout:
+            utili_stream.close()
+        if scarti_stream:
+            scarti_stream.close()
+
+    _log_to_stderr(f"🏁 Ricerca terminata! Utili:{len(search_pipeline.utili)}, Scarti:{len(search_pipeline.scartati)}")
+    for label, value in search_pipeline.stats().items():
+        _log_to_stderr(f"{label}: {value}")
+    if args.metrics:
+        metrics = search_pipeline.metrics
+        with open(args.metrics, "w", encoding="utf-8") as f:
+            f.write(metrics.to_prometheus() if args.metrics.endswith(".prom") else metrics.to_json())
+        _log_to_stderr(f"Metriche salvate in {args.metrics}")
+    return 0 if search_pipeline.utili else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,104 @@
+# contact_discovery.py
+import re
+from urllib.parse import urlparse, urljoin, urldefrag
+
+import lxml.html
+from lxml import etree
+
+# Parole chiave (in forma "slug") e peso; il punteggio di un link è il peso migliore trovato
+# nel percorso più quello trovato nel testo dell'ancora.
+CONTACT_LINK_KEYWORDS = {
+    "contatt": 10, "contact": 10, "scrivici": 8, "dove-siamo": 7, "lavora-con-noi": 6, "careers": 6,
+    "lavora": 5, "chi-siamo": 5, "about": 5, "sede": 4, "azienda": 4, "impressum": 3, "note-legali": 3,
+    "legal": 3, "team": 3, "privacy": 2,
+}
+SKIPPED_EXTENSIONS = (".pdf", ".jpg", ".jpeg", ".png", ".gif", ".webp", ".svg", ".zip", ".doc", ".docx", ".xml",
+                      ".mp4", ".css", ".js")
+SITEMAP_LOC_PATTERN = re.compile(r"<loc>\s*([^<\s]+)\s*</loc>", re.IGNORECASE)
+ANCHOR_PATTERN = re.compile(r"""<a\s[^>]*href\s*=\s*["']([^"']+)["'][^>]*>(.*?)</a>""", re.IGNORECASE | re.DOTALL)
+TAG_PATTERN = re.compile(r"<[^>]+>")
+SLUG_SEPARATORS = re.compile(r"[\s_/]+")
+
+
+def _slug(text):
+    return SLUG_SEPARATORS.sub("-", text.strip().lower())
+
+
+def _keyword_score(slug):
+    return max((weight for keyword, weight in CONTACT_LINK_KEYWORDS.items() if keyword in slug), default=0)
+
+
+def _site_key(netloc):
+    return netloc.lower().split(":")[0].removeprefix("www.")
+
+
+def _same_site_url(href, base_url):
+    """Restituisce l'URL assoluto (senza frammento) se è una pagina HTML dello stesso sito, altrimenti None."""
+    href = href.strip()
+    if not href or href.startswith(("mailto:", "tel:", "javascript:", "#")):
+        return None
+    absolute_url, _ = urldefrag(urljoin(base_url, href))
+    parsed = urlparse(absolute_url)
+    if parsed.scheme not in ("http", "https") or _site_key(parsed.netloc) != _site_key(urlparse(base_url).netloc):
+        return None
+    if parsed.path.lower().endswith(SKIPPED_EXTENSIONS) or parsed.path in ("", "/"):
+        return None
+    return absolute_url
+
+
+def _homepage_links(html_text):
+    try:
+        doc = lxml.html.fromstring(html_text)
+        return [(a.get("href"), " ".join(filter(None, [a.text_content(), a.get("title"), a.get("aria-label")])))
+                for a in doc.xpath("//a[@href]")]
+    except (etree.ParserError, ValueError):
+        return [(href, TAG_PATTERN.sub(" ", text)) for href, text in ANCHOR_PATTERN.findall(html_text)]
+
+
+def _rank(scored_urls, limit):
+    best = {}
+    for url, score in scored_urls:
+        if score > best.get(url, 0):
+            best[url] = score
+    # A parità di punteggio si preferiscono i percorsi più corti (pagine di primo livello).
+    ranked = sorted(best.items(), key=lambda item: (-item[1], len(urlparse(item[0]).path), item[0]))
+    return [url for url, _ in ranked[:limit]]
+
+
+def rank_contact_links(html_text, base_url, limit=10):
+    """Link della homepage verso pagine dello stesso sito, ordinati per probabilità di contenere contatti."""
+    if not html_text:
+        return []
+    scored_urls = []
+    for href, anchor_text in _homepage_links(html_text):
+        url = _same_site_url(href or "", base_url)
+        if not url:
+            continue
+        score = _keyword_score(_slug(urlparse(url).path)) + _keyword_score(_slug(anchor_text))
+        if score:
+            scored_urls.append((url, score))
+    return _rank(scored_urls, limit)
+
+
+def rank_sitemap_urls(sitemap_xml, base_url, limit=10):
+    """Come rank_contact_links, ma sulle <loc> di un sitemap.xml (i sitemap indice annidati vengono ignorati)."""
+    if not sitemap_xml:
+        return []
+    scored_urls = []
+    for loc in SITEMAP_LOC_PATTERN.findall(sitemap_xml):
+        url = _same_site_url(loc, base_url)
+        if not url:
+            continue
+        score = _keyword_score(_slug(urlparse(url).path))
+        if score:
+            scored_urls.append((url, score))
+    return _rank(scored_urls, limit)
+
+
+def merge_candidate_urls(*ranked_lists, limit=10):
+    merged = []
+    for ranked in ranked_lists:
+        for url in ranked:
+            if url not in merged:
+                merged.append(url)
+    return merged[:limit]
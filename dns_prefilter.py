@@ -0,0 +1,129 @@
+# dns_prefilter.py
+import asyncio
+import logging
+from urllib.parse import urlparse
+
+from diskcache import Cache
+
+from metrics import get_metrics, StatCounters, STAGE_DNS
+
+DNS_CACHE_DIR = ".cache/dns"
+DNS_POSITIVE_TTL_SECONDS = 24 * 3600
+DNS_NEGATIVE_TTL_SECONDS = 6 * 3600  # NXDOMAIN: un dominio appena registrato viene ricontrollato presto
+DNS_CACHE_SIZE_LIMIT = 8 * 1024 * 1024
+DNS_LOOKUP_TIMEOUT = 3
+DNS_MAX_CONCURRENT = 50
+
+_dns_prefilter = None
+
+
+class DnspythonResolver:
+    """Resolver predefinito (dnspython, asincrono): True se l'host ha un record A o AAAA, False se non esiste."""
+
+    def __init__(self, timeout=DNS_LOOKUP_TIMEOUT):
+        import dns.asyncresolver
+        self._resolver = dns.asyncresolver.Resolver()
+        self._resolver.lifetime = timeout
+
+    async def resolve(self, host):
+        import dns.resolver
+        for record_type in ("A", "AAAA"):
+            try:
+                await self._resolver.resolve(host, record_type)
+                return True
+            except dns.resolver.NXDOMAIN:
+                return False
+            except dns.resolver.NoAnswer:
+                continue
+        return False  # Il nome esiste ma non ha indirizzi: non c'è nessun sito da visitare.
+
+
+class StaticDnsResolver:
+    """Resolver locale per test e benchmark: risolvono solo gli host in known_hosts."""
+
+    def __init__(self, known_hosts, latency=0.0):
+        self.known_hosts = {h.lower() for h in known_hosts}
+        self.latency = latency
+
+    async def resolve(self, host):
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        return host in self.known_hosts
+
+
+def _site_host(site):
+    try:
+        return (urlparse(site).hostname or "").lower() or None
+    except ValueError:
+        return None
+
+
+class DnsPrefilter:
+    """
+    Pre-risoluzione DNS in batch delle aziende appena estratte dall'output LLM, prima di qualsiasi richiesta HTTP.
+    Risultati positivi e NXDOMAIN restano in cache su disco; timeout ed errori del resolver non vengono
+    memorizzati e il dominio viene lasciato passare (meglio un tentativo HTTP in più che un cliente perso).
+    """
+
+    def __init__(self, resolver=None, directory=DNS_CACHE_DIR, timeout=DNS_LOOKUP_TIMEOUT,
+                 max_concurrent=DNS_MAX_CONCURRENT):
+        self.resolver = resolver or DnspythonResolver(timeout)
+        self.timeout = timeout
+        self.max_concurrent = max_concurrent
+        self._cache = Cache(directory, size_limit=DNS_CACHE_SIZE_LIMIT, eviction_policy="least-recently-used")
+        self._counters = StatCounters("hit", "lookup", "inesistenti", "errori")
+
+    def reset_stats(self):
+        self._counters.reset()
+
+    def stats(self):
+        return self._counters.snapshot()
+
+    async def _timed_resolve(self, host):
+        with get_metrics().timer(STAGE_DNS):
+            return await asyncio.wait_for(self.resolver.resolve(host), self.timeout)
+
+    async def is_alive(self, host, semaphore=None):
+        cached = self._cache.get(host)
+        if cached is not None:
+            self._counters.inc("hit")
+            return cached
+        self._counters.inc("lookup")
+        try:
+            if semaphore is None:
+                alive = await self._timed_resolve(host)
+            else:
+                async with semaphore:
+                    alive = await self._timed_resolve(host)
+        except Exception as e:
+            self._counters.inc("errori")
+            logging.debug(f"DNS non conclusivo per {host}: {e!r}")
+            return True
+        self._cache.set(host, alive, expire=DNS_POSITIVE_TTL_SECONDS if alive else DNS_NEGATIVE_TTL_SECONDS)
+        return alive
+
+    async def filter_companies(self, companies):
+        """Divide [(nome, sito), ...] in (risolvibili, inesistenti) mantenendo l'ordine; ogni host è risolto una volta."""
+        hosts = {site: _site_host(site) for _, site in companies}
+        unique_hosts = [h for h in dict.fromkeys(hosts.values()) if h]
+        semaphore = asyncio.Semaphore(self.max_concurrent)
+        results = await asyncio.gather(*(self.is_alive(h, semaphore) for h in unique_hosts))
+        alive_by_host = dict(zip(unique_hosts, results))
+        alive, dead = [], []
+        for name, site in companies:
+            if alive_by_host.get(hosts[site], False):
+                alive.append((name, site))
+            else:
+                dead.append((name, site))
+                self._counters.inc("inesistenti")
+        return alive, dead
+
+    def clear(self):
+        self._cache.clear()
+
+
+def get_dns_prefilter():
+    global _dns_prefilter
+    if _dns_prefilter is None:
+        _dns_prefilter = DnsPrefilter()
+    return _dns_prefilter
@@ -0,0 +1,168 @@
+# domain_health.py
+import json
+import os
+import tempfile
+import threading
+import time
+
+DOMAIN_HEALTH_FILE = ".cache/domain_health.json"
+
+CLOSED, OPEN, HALF_OPEN = "closed", "open", "half_open"
+
+
+class DomainHealthRegistry:
+    """
+    Registro persistente e thread-safe dello stato di salute dei domini (circuit breaker).
+
+    - closed: il dominio risponde, le richieste passano.
+    - open: troppi fallimenti consecutivi, le richieste vengono rifiutate senza aprire connessioni
+      fino alla fine del cooldown, che raddoppia a ogni nuova apertura.
+    - half_open: cooldown scaduto, passa una sola richiesta di prova; se va bene il circuito si
+      richiude, altrimenti si riapre con un cooldown più lungo. Il raddoppio si azzera al primo successo
+      a circuito già chiuso: un giorno storto non allunga per sempre i cooldown successivi.
+    I record non aggiornati da più di record_ttl secondi vengono dimenticati.
+    """
+
+    def __init__(self, path=DOMAIN_HEALTH_FILE, failure_threshold=1, base_cooldown=30 * 60,
+                 max_cooldown=7 * 24 * 3600, trial_timeout=60, record_ttl=30 * 24 * 3600):
+        self.path = path
+        self.failure_threshold = failure_threshold
+        self.base_cooldown = base_cooldown
+        self.max_cooldown = max_cooldown
+        self.trial_timeout = trial_timeout
+        self.record_ttl = record_ttl
+        self._lock = threading.Lock()
+        self._save_lock = threading.Lock()  # Serializza i salvataggi senza bloccare chi registra esiti.
+        self._domains = {}
+        self.load()
+
+    @staticmethod
+    def _new_record():
+        return {"state": CLOSED, "failures": 0, "consecutive_failures": 0, "successes": 0, "opened_count": 0,
+                "avg_latency": None, "last_error": None, "last_seen": time.time(), "open_until": 0.0,
+                "trial_started_at": 0.0}
+
+    def _record(self, domain):
+        record = self._domains.get(domain)
+        if record is None:
+            record = self._domains[domain] = self._new_record()
+        return record
+
+    def _refresh_state(self, record, now):
+        if record["state"] == OPEN and now >= record["open_until"]:
+            record["state"] = HALF_OPEN
+            record["trial_started_at"] = 0.0
+
+    def is_blocked(self, domain):
+        """Controllo senza effetti collaterali: True se il dominio non accetterebbe una richiesta ora."""
+        now = time.time()
+        with self._lock:
+            record = self._domains.get(domain)
+            if record is None:
+                return False
+            self._refresh_state(record, now)
+            if record["state"] == OPEN:
+                return True
+            return record["state"] == HALF_OPEN and now - record["trial_started_at"] < self.trial_timeout
+
+    def allow_request(self, domain):
+        """Da chiamare subito prima di aprire una connessione; in half_open riserva l'unica richiesta di prova."""
+        now = time.time()
+        with self._lock:
+            record = self._domains.get(domain)
+            if record is None:
+                return True
+            self._refresh_state(record, now)
+            if record["state"] == CLOSED:
+                return True
+            if record["state"] == HALF_OPEN and now - record["trial_started_at"] >= self.trial_timeout:
+                record["trial_started_at"] = now
+                return True
+            return False
+
+    def record_success(self, domain, latency=None):
+        with self._lock:
+            record = self._record(domain)
+            if record["state"] == CLOSED:
+                record["opened_count"] = 0
+            record.update(state=CLOSED, consecutive_failures=0, last_seen=time.time(), trial_started_at=0.0)
+            record["successes"] += 1
+            if latency is not None:
+                previous = record["avg_latency"]
+                record["avg_latency"] = latency if previous is None else 0.8 * previous + 0.2 * latency
+
+    def record_failure(self, domain, error=None):
+        now = time.time()
+        with self._lock:
+            record = self._record(domain)
+            record["failures"] += 1
+            record["consecutive_failures"] += 1
+            record["last_seen"] = now
+            record["last_error"] = str(error)[:200] if error is not None else None
+            if record["state"] == HALF_OPEN or record["consecutive_failures"] >= self.failure_threshold:
+                cooldown = min(self.max_cooldown, self.base_cooldown * (2 ** record["opened_count"]))
+                record.update(state=OPEN, open_until=now + cooldown, trial_started_at=0.0)
+                record["opened_count"] += 1
+
+    # Interfaccia compatibile con il vecchio set di domini blacklistati.
+    def __contains__(self, domain):
+        return self.is_blocked(domain)
+
+    def add(self, domain):
+        self.record_failure(domain, "blacklist manuale")
+
+    def open_domains(self):
+        now = time.time()
+        with self._lock:
+            return [d for d, r in self._domains.items() if r["state"] == OPEN and now < r["open_until"]]
+
+    def __iter__(self):
+        return iter(self.open_domains())
+
+    def __len__(self):
+        return len(self.open_domains())
+
+    def get(self, domain):
+        with self._lock:
+            record = self._domains.get(domain)
+            return dict(record) if record else None
+
+    def state_counts(self):
+        now = time.time()
+        counts = {CLOSED: 0, OPEN: 0, HALF_OPEN: 0}
+        with self._lock:
+            for record in self._domains.values():
+                self._refresh_state(record, now)
+                counts[record["state"]] += 1
+        return counts
+
+    def load(self):
+        if not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError) as e:
+            print(f"Registro salute domini non leggibile ({self.path}): {e}")
+            return
+        cutoff = time.time() - self.record_ttl
+        with self._lock:
+            self._domains = {d: {**self._new_record(), **r} for d, r in data.items() if r.get("last_seen", 0) >= cutoff}
+
+    def save(self):
+        # Il registro è condiviso tra sessioni: due save() sovrapposti non devono scambiarsi il file
+        # temporaneo, né un'istantanea più vecchia deve sostituire una più recente.
+        with self._save_lock:
+            with self._lock:
+                data = json.dumps(self._domains)
+            directory = os.path.dirname(self.path) or "."
+            os.makedirs(directory, exist_ok=True)
+            fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".domain_health.", suffix=".tmp")
+            try:
+                with os.fdopen(fd, "w", encoding="utf-8") as f:
+                    f.write(data)
+                os.replace(tmp_path, self.path)
+            except BaseException:
+                if os.path.exists(tmp_path):
+                    os.remove(tmp_path)
+                raise
@@ -2,7 +2,11 @@
 import streamlit as st
 import pandas as pd
 import json
+import time
 from email_sender import EmailSender
+from bulk_sender import BulkSender, SendJob, GMAIL_SENDS_PER_SECOND, GMAIL_DAILY_SEND_LIMIT
+from lead_store import get_lead_store
+from llm_parser import site_domain
 
 
 def show_email_interface(json_string_data=None):
@@ -46,6 +50,7 @@ def show_email_interface(json_string_data=None):
         # generiamo un template generico. L'AI genererà un testo che l'utente può poi personalizzare.
         # Se si vuole personalizzazione del template, serve un input esplicito per l'AI su quale azienda basarlo.
         # Per ora, usiamo il primo elemento solo per il prompt dell'AI per dare un'idea del contesto.
+        new_variant = st.checkbox("🎲 Nuova variante (ignora la cache)", key="email_template_new_variant")
         if st.button("🤖 Genera Email con AI (Template)", use_container_width=True):
             with st.spinner("🧠 Generazione della mail template..."):
                 # Prendo il primo elemento del JSON per dare un contesto all'AI,
@@ -54,7 +59,8 @@ def show_email_interface(json_string_data=None):
                 first_example_site = df_json.iloc[0].get("Sito Web", "il loro sito web")
 
                 # La funzione generate_bulk_message è già progettata per questo.
-                body_template = sender.generate_bulk_message(first_company_name, first_example_site)
+                body_template = sender.generate_bulk_message(first_company_name, first_example_site,
+                                                             use_cache=not new_variant)
                 st.session_state.email_body_template = body_template
                 st.success("✅ Email template generato. Puoi modificarlo e verrà usato per tutte le email.")
 
@@ -73,56 +79,65 @@ def show_email_interface(json_string_data=None):
             height=250,
             key="manual_editable_message"
         )
+        resend_contacted = st.checkbox("🔁 Invia anche alle aziende già contattate", value=False,
+                                       key="resend_contacted_companies")
         submitted = st.form_submit_button("📨 Invia Email")
 
         if submitted:
-            with st.spinner("📤 Invio email in corso..."):
-                results = []
-                # Iteriamo su ogni riga del DataFrame
-                for index, row in df_json.iterrows():
-                    recipient_email_str = row.get("Email trovate")  # Ottieni la stringa delle email
-                    company_name_for_email = row.get("Nome Azienda",
-                                                     "Azienda Sconosciuta")  # Ottieni il nome dell'azienda specifico
-                    example_site_for_email = row.get("Sito Web", "sito web")  # Ottieni il sito web specifico
-
-                    # Estrai le email singole, come fa EmailSender.extract_all_emails
-                    emails_to_send_for_row = [e.strip() for e in recipient_email_str.split(",") if
-                                              e.strip()] if isinstance(recipient_email_str, str) else []
-
-                    if not emails_to_send_for_row:
-                        results.append(
-                            (f"Riga {index + 1} ({company_name_for_email})", "Nessuna email valida trovata."))
-                        continue
-
-                    # Personalizza il messaggio per questa specifica azienda
-                    # Usiamo il template e lo sostituiamo con i dati dell'azienda corrente.
-                    # Questo è un esempio basilare, potresti volere un sistema di template più robusto.
-                    # Per ora, assumiamo che il template possa contenere placeholder come {NomeAzienda} o {SitoWeb}
-                    # ESEMPIO SEMPLICE DI PERSONALIZZAZIONE (da migliorare se necessario)
-                    # Ad esempio, il prompt di generate_bulk_message è già abbastanza generico,
-                    # e la personalizzazione avviene nel corpo generato che già cita il nome azienda/sito.
-                    # Se il template è generico, lo usiamo così com'è per ogni email,
-                    # ma il tracking sarà specifico per azienda.
-                    # Se l'utente ha modificato il template, lo inviamo così come sta.
-
-                    # La logica di generazione del messaggio è già gestita da EmailSender.generate_bulk_message
-                    # che viene chiamato all'inizio per popolare il template.
-                    # Se l'utente modifica il template, inviamo quello.
-
-                    # Se vuoi personalizzare ulteriormente il messaggio per ogni email,
-                    # devi fare una sostituzione di placeholder qui. Ad esempio:
-                    # personalized_message = message_template.replace("{NomeAzienda}", company_name_for_email)
-                    # personalized_message = personalized_message.replace("{SitoWeb}", example_site_for_email)
-
-                    # Per il tuo caso, la modifica più importante è assicurarsi che company_name_for_email
-                    # venga passato correttamente per il tracking.
-
-                    for email in emails_to_send_for_row:
-                        # Passa il nome dell'azienda specifico per questa riga al metodo send_email
-                        success, status = sender.send_email(email, subject, message_template,
-                                                            company_name_for_email)  # <--- QUESTA È LA MODIFICA CHIAVE
-                        results.append((f"{company_name_for_email} ({email})", status))
-
-            st.success("✅ Invio completato")
-            for company_email_info, status in results:
-                st.write(f"{company_email_info}: {status}")
\ No newline at end of file
+            lead_store = get_lead_store()
+            jobs, skipped = [], []
+            # Iteriamo su ogni riga del DataFrame
+            for index, row in df_json.iterrows():
+                recipient_email_str = row.get("Email trovate")  # Ottieni la stringa delle email
+                company_name_for_email = row.get("Nome Azienda",
+                                                 "Azienda Sconosciuta")  # Ottieni il nome dell'azienda specifico
+                # Chiave dell'archivio lead: dominio normalizzato, così "https://www.x.it/" e "x.it" coincidono.
+                domain_for_email = site_domain(row.get("Sito Web"))
+
+                # Estrai le email singole, come fa EmailSender.extract_all_emails
+                emails_to_send_for_row = [e.strip() for e in recipient_email_str.split(",") if
+                                          e.strip()] if isinstance(recipient_email_str, str) else []
+
+                if not emails_to_send_for_row:
+                    skipped.append((f"Riga {index + 1} ({company_name_for_email})", "Nessuna email valida trovata."))
+                    continue
+
+                # Archivio lead condiviso tra le ricerche: un'azienda già contattata non riceve un'altra email.
+                # Senza dominio non c'è modo di riconoscerla, quindi nessun controllo.
+                contacted_at = lead_store.contacted_at(domain_for_email) if domain_for_email else None
+                if contacted_at and not resend_contacted:
+                    skipped.append((company_name_for_email,
+                                    f"Già contattata il {time.strftime('%d/%m/%Y', time.localtime(contacted_at))}, saltata."))
+                    continue
+
+                # Il template viene inviato così com'è; il tracking resta specifico per azienda
+                # (company_name_for_email arriva fino alla registrazione sul server di tracciamento).
+                for email in emails_to_send_for_row:
+                    jobs.append(SendJob(company_name_for_email, email, domain_for_email))
+
+            for company_email_info, status in skipped:
+                st.write(f"{company_email_info}: {status}")
+            if not jobs:
+                st.info("Nessuna email da inviare.")
+                return
+
+            # Invio in parallelo con limite sulla quota Gmail: ogni esito compare appena l'invio termina,
+            # senza bloccare la pagina per tutta la durata della campagna.
+            st.caption(f"📤 {len(jobs)} email da inviare, al massimo {GMAIL_SENDS_PER_SECOND:g} al secondo "
+                       f"(quota Gmail). Già inviate oggi: {lead_store.sends_today()}/{GMAIL_DAILY_SEND_LIMIT}.")
+            progress_bar = st.progress(0.0)
+            sent_count, failed_count = 0, 0
+            bulk_sender = BulkSender(sender, send_log=lead_store)
+            for done_count, result in enumerate(bulk_sender.send_all(jobs, subject, message_template), start=1):
+                if result.success:
+                    sent_count += 1
+                    if result.job.site:
+                        lead_store.mark_contacted(result.job.site, result.job.company_name)
+                else:
+                    failed_count += 1
+                retry_note = f" ({result.attempts} tentativi)" if result.attempts > 1 else ""
+                st.write(f"{result.job.company_name} ({result.job.email}): {result.status}{retry_note}")
+                progress_bar.progress(done_count / len(jobs),
+                                      text=f"{done_count}/{len(jobs)} - inviate {sent_count}, errori {failed_count}")
+
+            st.success(f"✅ Invio completato: {sent_count} inviate, {failed_count} non inviate")
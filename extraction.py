@@ -0,0 +1,96 @@
+# extraction.py
+import html
+import re
+
+import lxml.html
+from lxml import etree
+
+from utils import clean_valid_emails_batch, EMAIL_CANDIDATE_REGEX, PRIORITY_KEYWORDS
+from metrics import get_metrics, STAGE_HTML_PARSE
+
+PARTITA_IVA_REGEX = r"\b(IT)?\s?\d{11}\b"
+
+# Pattern precompilati una sola volta per processo.
+EMAIL_CANDIDATE_PATTERN = re.compile(EMAIL_CANDIDATE_REGEX)
+PARTITA_IVA_PATTERN = re.compile(PARTITA_IVA_REGEX)
+MAILTO_PATTERN = re.compile(r"""href\s*=\s*["']?\s*mailto:([^"'?>\s]+)""", re.IGNORECASE)
+TAG_PATTERN = re.compile(r"<[^>]+>")
+# Solo i tag di blocco separano le parole: quelli in linea spezzano spesso un indirizzo
+# (es. "<strong>info</strong>@azienda.it") e vanno tolti senza lasciare spazi.
+BLOCK_TAGS = ("p", "div", "li", "br", "td", "th", "tr", "h1", "h2", "h3", "h4", "h5", "h6", "ul", "ol", "table",
+              "section", "article", "header", "footer", "nav", "main", "aside")
+BLOCK_TAG_PATTERN = re.compile(r"</?(?:%s)\b[^>]*>" % "|".join(BLOCK_TAGS), re.IGNORECASE)
+NON_DIGIT_PATTERN = re.compile(r"\D")
+
+# "lxml": DOM veloce in C, testo estratto in un solo passaggio.
+# "regex": nessun DOM, i tag vengono rimossi via regex (più veloce, leggermente meno preciso).
+EXTRACTION_MODES = ("lxml", "regex")
+DEFAULT_EXTRACTION_MODE = "lxml"
+
+
+def _page_text_lxml(html_text):
+    doc = lxml.html.fromstring(html_text)
+    mailtos = [href[7:] for href in doc.xpath('//a[starts-with(@href, "mailto:")]/@href')]
+    # A capo prima e dopo ogni blocco: paragrafi e celle adiacenti non si incollano, i tag in linea sì.
+    # Header e footer sono già nel documento, non servono passaggi dedicati.
+    for element in doc.iter(*BLOCK_TAGS):
+        element.text = "\n" + (element.text or "")
+        element.tail = "\n" + (element.tail or "")
+    return "".join(doc.itertext()), mailtos
+
+
+def _page_text_regex(html_text):
+    mailtos = MAILTO_PATTERN.findall(html_text)
+    text = TAG_PATTERN.sub("", BLOCK_TAG_PATTERN.sub("\n", html_text))
+    return html.unescape(text), mailtos
+
+
+def is_valid_partita_iva(digits):
+    """Controlla la cifra di controllo di una partita IVA italiana di 11 cifre."""
+    if len(digits) != 11 or not digits.isdigit():
+        return False
+    total = 0
+    for i, char in enumerate(digits[:10]):
+        n = int(char)
+        if i % 2:
+            n = n * 2 - 9 if n > 4 else n * 2
+        total += n
+    return (10 - total % 10) % 10 == int(digits[10])
+
+
+def _find_partita_iva(*texts):
+    """Prima P.IVA trovata (solo cifre), preferendo quelle con cifra di controllo valida."""
+    first_match = None
+    for text in texts:
+        for match in PARTITA_IVA_PATTERN.finditer(text):
+            digits = NON_DIGIT_PATTERN.sub("", match.group(0))
+            if is_valid_partita_iva(digits):
+                return digits
+            first_match = first_match or digits
+    return first_match
+
+
+def extract_emails_and_piva(html_text, url_context="", mode=DEFAULT_EXTRACTION_MODE):
+    """
+    Estrae fino a 3 email (prima quelle con PRIORITY_KEYWORDS) e la P.IVA (stringa di 11 cifre
+    oppure None, quindi utilizzabile anche come booleano) con un solo passaggio regex sul testo della pagina.
+    """
+    if not html_text or not html_text.strip():
+        return [], None
+    with get_metrics().timer(STAGE_HTML_PARSE):
+        if mode == "lxml":
+            try:
+                text_content, mailtos = _page_text_lxml(html_text)
+            except (etree.ParserError, ValueError):
+                text_content, mailtos = _page_text_regex(html_text)
+        else:
+            text_content, mailtos = _page_text_regex(html_text)
+
+    text_content = text_content.lower()
+    candidates = set(EMAIL_CANDIDATE_PATTERN.findall(text_content))
+    candidates.update(m.split("?", 1)[0] for m in mailtos)
+    partita_iva = _find_partita_iva(text_content, html_text)
+
+    filtered_emails = list(clean_valid_emails_batch(candidates))
+    filtered_emails.sort(key=lambda e: (not any(k in e for k in PRIORITY_KEYWORDS), e))
+    return filtered_emails[:3], partita_iva
@@ -4,6 +4,7 @@ from google import genai
 from google.genai import types
 import os
 from dotenv import load_dotenv
+from llm_cache import get_llm_cache
 
 load_dotenv() #Looks for the .env file in the files of the project.
 
@@ -18,15 +19,19 @@ if not GEMINI_API_KEY:
 
 client = genai.Client(api_key=GEMINI_API_KEY)
 
-def call_gemini_flash(prompt, system_instruction, temperature=0.7, max_tokens=800):
-    response = client.models.generate_content(
-        model="gemini-2.0-flash",
-        contents=prompt,
-        config=types.GenerateContentConfig(
-            system_instruction=system_instruction,
-            temperature=temperature,
-            max_output_tokens=max_tokens
+def call_gemini_flash(prompt, system_instruction, temperature=0.7, max_tokens=800, use_cache=True):
+    def _generate():
+        response = client.models.generate_content(
+            model="gemini-2.0-flash",
+            contents=prompt,
+            config=types.GenerateContentConfig(
+                system_instruction=system_instruction,
+                temperature=temperature,
+                max_output_tokens=max_tokens
+            )
         )
-    )
-    logging.debug(f"📥 Risposta grezza da Gemini: {response.text}")
-    return response.text.strip()
+        logging.debug(f"📥 Risposta grezza da Gemini: {response.text}")
+        return response.text.strip()
+
+    return get_llm_cache().get_or_call("gemini-2.0-flash", prompt, system_instruction, temperature, max_tokens,
+                                       _generate, use_cache)
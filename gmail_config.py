@@ -13,10 +13,10 @@ SCOPES = [
 ]
 
 
-def get_gmail_service():
+def get_gmail_credentials():
     """
-    Ottiene il servizio Gmail API v1.
-    Gestisce l'autenticazione, il refresh del token e la creazione del servizio.
+    Ottiene le credenziali OAuth per Gmail.
+    Gestisce l'autenticazione (flusso nel browser alla prima esecuzione) e il refresh del token.
     """
     creds = None
     # Il file token.json memorizza i token di accesso e di refresh dell'utente
@@ -46,6 +46,20 @@ def get_gmail_service():
         with open('token.json', 'w') as token:
             token.write(creds.to_json())
 
-    # Costruisci e restituisci il servizio Gmail
-    service = build('gmail', 'v1', credentials=creds)
-    return service
\ No newline at end of file
+    return creds
+
+
+def build_gmail_service(creds):
+    """
+    Servizio Gmail API v1 con credenziali già ottenute. Il client HTTP sottostante (httplib2) non è
+    thread-safe: chi invia da più thread deve costruire un servizio per thread.
+    """
+    return build('gmail', 'v1', credentials=creds)
+
+
+def get_gmail_service():
+    """
+    Ottiene il servizio Gmail API v1.
+    Gestisce l'autenticazione, il refresh del token e la creazione del servizio.
+    """
+    return build_gmail_service(get_gmail_credentials())
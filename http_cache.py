@@ -0,0 +1,92 @@
+# http_cache.py
+import time
+
+from diskcache import Cache
+
+from metrics import get_metrics, hit_rate
+
+HTTP_CACHE_DIR = ".cache/http"
+HTTP_CACHE_TTL_SECONDS = 6 * 60 * 60
+HTTP_CACHE_SIZE_LIMIT = 256 * 1024 * 1024
+
+
+class CachedResponse:
+    """Risposta ricostruita dalla cache, con gli stessi attributi usati dallo scraper."""
+
+    def __init__(self, url, status_code, text, headers):
+        self.url = url
+        self.status_code = status_code
+        self.text = text
+        self.headers = headers
+
+    def raise_for_status(self):
+        return self
+
+
+class HttpCache:
+    """
+    Cache su disco delle risposte HTTP, indicizzata per URL.
+    Le voci entro il TTL vengono servite direttamente; quelle scadute vengono rivalidate con
+    ETag/Last-Modified. Lo spazio occupato è limitato con eviction LRU.
+    La cache è condivisa tra le sessioni, i contatori no: hit, miss e rivalidazioni finiscono nel registro
+    di metriche della ricerca che ha fatto la richiesta.
+    """
+
+    def __init__(self, directory=HTTP_CACHE_DIR, ttl=HTTP_CACHE_TTL_SECONDS, size_limit=HTTP_CACHE_SIZE_LIMIT):
+        self.ttl = ttl
+        self._cache = Cache(directory, size_limit=size_limit, eviction_policy="least-recently-used")
+
+    @staticmethod
+    def stats(metrics=None):
+        """Contatori della cache registrati in metrics (default: il registro attivo)."""
+        metrics = metrics or get_metrics()
+        counts = {key: metrics.counter(f"cache_http_{key}") for key in ("hit", "scadute", "rivalidate", "miss")}
+        # Le voci scadute ma confermate da un 304 contano come hit: il corpo non viene riscaricato.
+        total = counts["hit"] + counts["scadute"] + counts["miss"]
+        return {**counts, "hit_rate": hit_rate(counts["hit"] + counts["rivalidate"], total)}
+
+    def lookup(self, url):
+        """Restituisce (voce, fresca) e aggiorna i contatori hit/scadute/miss."""
+        entry = self._cache.get(url)
+        if entry is None:
+            get_metrics().inc("cache_http_miss")
+            return None, False
+        fresh = (time.time() - entry["fetched_at"]) < self.ttl
+        get_metrics().inc("cache_http_hit" if fresh else "cache_http_scadute")
+        return entry, fresh
+
+    @staticmethod
+    def validation_headers(entry):
+        if not entry:
+            return {}
+        headers = {}
+        if entry["headers"].get("etag"):
+            headers["If-None-Match"] = entry["headers"]["etag"]
+        if entry["headers"].get("last-modified"):
+            headers["If-Modified-Since"] = entry["headers"]["last-modified"]
+        return headers
+
+    def mark_revalidated(self, url, entry):
+        """Risposta 304: la voce in cache è ancora valida, ne rinnova la data."""
+        entry = dict(entry, fetched_at=time.time())
+        self._cache.set(url, entry)
+        get_metrics().inc("cache_http_rivalidate")
+        return self.to_response(entry)
+
+    def store(self, url, response):
+        # Le risposte non lette (PDF, immagini, pagine oltre la soglia) non vanno in cache.
+        if response.status_code != 200 or getattr(response, "skipped", None):
+            return
+        headers = {k: response.headers[k] for k in ("etag", "last-modified", "content-type") if k in response.headers}
+        # La chiave resta l'URL richiesto, ma "url" è quello finale dopo i redirect: su un hit i link
+        # relativi della pagina vanno risolti rispetto a quest'ultimo, come per una risposta appena scaricata.
+        final_url = str(getattr(response, "url", None) or url)
+        self._cache.set(url, {"url": final_url, "status_code": response.status_code, "text": response.text,
+                              "headers": headers, "fetched_at": time.time()})
+
+    @staticmethod
+    def to_response(entry):
+        return CachedResponse(entry["url"], entry["status_code"], entry["text"], entry["headers"])
+
+    def clear(self):
+        self._cache.clear()
@@ -0,0 +1,166 @@
+# lead_store.py
+import os
+import sqlite3
+import threading
+import time
+
+from extraction import is_valid_partita_iva
+
+LEAD_STORE_PATH = ".cache/leads.sqlite3"
+SCARTI_RETRY_AFTER_SECONDS = 7 * 24 * 3600  # Gli scarti (spesso errori temporanei) si ritentano dopo una settimana.
+LOOKUP_CHUNK_SIZE = 500  # Parametri per singola query IN (SQLite ne accetta al massimo 999 nelle versioni vecchie).
+NEW, UPDATED, DUPLICATE_PIVA = "nuovo", "aggiornato", "duplicato_piva"
+
+_lead_store = None
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS leads (
+    domain TEXT PRIMARY KEY,
+    piva TEXT,
+    duplicate_of TEXT,
+    name TEXT NOT NULL,
+    site TEXT,
+    emails TEXT,
+    useful INTEGER NOT NULL,
+    settore TEXT,
+    regione TEXT,
+    first_seen REAL NOT NULL,
+    last_seen REAL NOT NULL,
+    last_run_id TEXT,
+    contacted_at REAL
+);
+CREATE UNIQUE INDEX IF NOT EXISTS idx_leads_piva ON leads (piva) WHERE piva IS NOT NULL;
+CREATE INDEX IF NOT EXISTS idx_leads_search ON leads (settore, regione, last_seen);
+CREATE TABLE IF NOT EXISTS daily_sends (
+    day TEXT PRIMARY KEY,
+    sent INTEGER NOT NULL
+);
+"""
+
+
+class LeadStore:
+    """
+    Archivio persistente (SQLite) delle aziende già trovate in tutte le ricerche, con indice univoco
+    sul dominio normalizzato e sulla P.IVA: le ricerche successive le saltano prima di qualsiasi fetch
+    e l'invio email non le ricontatta. Le ricerche usano la chiave primaria, quindi restano a tempo
+    costante anche con decine di migliaia di lead. Tiene anche il conteggio delle email inviate per
+    giorno, condiviso tra sessioni e invii successivi, per restare nella quota giornaliera di Gmail.
+    """
+
+    def __init__(self, path=LEAD_STORE_PATH):
+        self.path = path
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(SCHEMA)
+        self._lock = threading.Lock()
+
+    def known_domains(self, domains):
+        """Sottoinsieme di domains da non rivisitare: lead utili, o scartati da meno di SCARTI_RETRY_AFTER_SECONDS."""
+        domains = list(dict.fromkeys(d for d in domains if d))
+        retry_cutoff = time.time() - SCARTI_RETRY_AFTER_SECONDS
+        known = set()
+        with self._lock:
+            for start in range(0, len(domains), LOOKUP_CHUNK_SIZE):
+                chunk = domains[start:start + LOOKUP_CHUNK_SIZE]
+                placeholders = ",".join("?" * len(chunk))
+                known.update(row[0] for row in self._conn.execute(
+                    f"SELECT domain FROM leads WHERE domain IN ({placeholders}) AND (useful = 1 OR last_seen >= ?)",
+                    chunk + [retry_cutoff]))
+        return known
+
+    def domain_for_piva(self, piva):
+        if not piva:
+            return None
+        with self._lock:
+            row = self._conn.execute("SELECT domain FROM leads WHERE piva = ?", (piva,)).fetchone()
+        return row[0] if row else None
+
+    def recent_names(self, settore, regione, limit=50):
+        """Nomi delle aziende trovate più di recente per la stessa ricerca (per le esclusioni nel prompt)."""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT name FROM leads WHERE settore = ? AND regione = ? ORDER BY last_seen DESC LIMIT ?",
+                (settore.lower(), regione.lower(), limit)).fetchall()
+        return [row[0] for row in rows]
+
+    def upsert_lead(self, domain, name, site, emails, piva, useful, settore=None, regione=None, run_id=None):
+        """
+        Inserisce o aggiorna il lead del dominio. Se la P.IVA appartiene già a un altro dominio il lead
+        viene salvato senza P.IVA e con duplicate_of, e il risultato è DUPLICATE_PIVA.
+        """
+        piva = piva if piva and is_valid_partita_iva(piva) else None
+        now = time.time()
+        with self._lock:
+            owner = None
+            if piva:
+                row = self._conn.execute("SELECT domain FROM leads WHERE piva = ?", (piva,)).fetchone()
+                owner = row[0] if row and row[0] != domain else None
+            existed = self._conn.execute("SELECT 1 FROM leads WHERE domain = ?", (domain,)).fetchone() is not None
+            self._conn.execute(
+                "INSERT INTO leads (domain, piva, duplicate_of, name, site, emails, useful, settore, regione, "
+                "first_seen, last_seen, last_run_id) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?) "
+                "ON CONFLICT(domain) DO UPDATE SET piva = COALESCE(excluded.piva, leads.piva), "
+                "duplicate_of = COALESCE(excluded.duplicate_of, leads.duplicate_of), name = excluded.name, "
+                "site = excluded.site, emails = COALESCE(excluded.emails, leads.emails), "
+                "useful = MAX(leads.useful, excluded.useful), last_seen = excluded.last_seen, "
+                "last_run_id = excluded.last_run_id",
+                (domain, None if owner else piva, owner, name, site, ", ".join(emails) if emails else None,
+                 int(bool(useful)), (settore or "").lower() or None, (regione or "").lower() or None, now, now,
+                 run_id))
+        if owner:
+            return DUPLICATE_PIVA
+        return UPDATED if existed else NEW
+
+    def contacted_at(self, domain):
+        with self._lock:
+            row = self._conn.execute("SELECT contacted_at FROM leads WHERE domain = ?", (domain,)).fetchone()
+        return row[0] if row else None
+
+    def mark_contacted(self, domain, name=None):
+        """Segna il dominio come contattato; se non era in archivio (es. JSON caricato a mano) lo aggiunge."""
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO leads (domain, name, useful, first_seen, last_seen, contacted_at) VALUES (?, ?, 1, ?, ?, ?) "
+                "ON CONFLICT(domain) DO UPDATE SET contacted_at = excluded.contacted_at",
+                (domain, name or domain, now, now, now))
+
+    @staticmethod
+    def _today():
+        return time.strftime("%Y-%m-%d")
+
+    def sends_today(self):
+        with self._lock:
+            row = self._conn.execute("SELECT sent FROM daily_sends WHERE day = ?", (self._today(),)).fetchone()
+        return row[0] if row else 0
+
+    def reserve_daily_send(self, limit):
+        """Prenota un invio nel giorno corrente se restano meno di limit invii; restituisce il giorno o None."""
+        day = self._today()
+        with self._lock:
+            self._conn.execute("INSERT INTO daily_sends (day, sent) VALUES (?, 0) ON CONFLICT(day) DO NOTHING", (day,))
+            cursor = self._conn.execute("UPDATE daily_sends SET sent = sent + 1 WHERE day = ? AND sent < ?",
+                                        (day, limit))
+        return day if cursor.rowcount == 1 else None
+
+    def release_daily_send(self, day):
+        """Annulla una prenotazione di reserve_daily_send (messaggio non partito)."""
+        with self._lock:
+            self._conn.execute("UPDATE daily_sends SET sent = sent - 1 WHERE day = ? AND sent > 0", (day,))
+
+    def count(self):
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM leads").fetchone()[0]
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+def get_lead_store():
+    global _lead_store
+    if _lead_store is None:
+        _lead_store = LeadStore()
+    return _lead_store
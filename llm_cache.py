@@ -0,0 +1,71 @@
+# llm_cache.py
+import hashlib
+import json
+import logging
+import time
+
+from diskcache import Cache
+
+from metrics import get_metrics, StatCounters, hit_rate, STAGE_LLM
+
+LLM_CACHE_DIR = ".cache/llm"
+LLM_CACHE_TTL_SECONDS = 24 * 60 * 60
+LLM_CACHE_SIZE_LIMIT = 64 * 1024 * 1024
+
+_llm_cache = None
+
+
+class LlmResponseCache:
+    """
+    Cache persistente delle risposte LLM, indicizzata su modello, prompt, system instruction,
+    temperatura e max token. Tiene traccia di hit, miss e della latenza risparmiata.
+    """
+
+    def __init__(self, directory=LLM_CACHE_DIR, ttl=LLM_CACHE_TTL_SECONDS, size_limit=LLM_CACHE_SIZE_LIMIT):
+        self.ttl = ttl
+        self._cache = Cache(directory, size_limit=size_limit, eviction_policy="least-recently-used")
+        self._counters = StatCounters("hit", "miss", "bypass", "latenza_risparmiata_s")
+
+    def reset_stats(self):
+        self._counters.reset()
+
+    def stats(self):
+        counts = self._counters.snapshot()
+        return {"hit": counts["hit"], "miss": counts["miss"], "bypass": counts["bypass"],
+                "hit_rate": hit_rate(counts["hit"], counts["hit"] + counts["miss"]),
+                "latenza_risparmiata_s": round(counts["latenza_risparmiata_s"], 2)}
+
+    @staticmethod
+    def make_key(model, prompt, system_instruction, temperature, max_tokens):
+        raw_key = json.dumps([model, prompt, system_instruction, temperature, max_tokens], ensure_ascii=False)
+        return hashlib.sha256(raw_key.encode("utf-8")).hexdigest()
+
+    def get_or_call(self, model, prompt, system_instruction, temperature, max_tokens, call_fn, use_cache=True):
+        """Restituisce la risposta in cache oppure chiama call_fn() e la memorizza. use_cache=False forza una nuova chiamata."""
+        key = self.make_key(model, prompt, system_instruction, temperature, max_tokens)
+        if use_cache:
+            entry = self._cache.get(key)
+            if entry is not None:
+                self._counters.inc("hit")
+                self._counters.inc("latenza_risparmiata_s", entry["latency"])
+                logging.debug(f"♻️ Risposta LLM da cache ({model}, {entry['latency']:.1f}s risparmiati)")
+                return entry["text"]
+        started = time.monotonic()
+        text = call_fn()
+        latency = time.monotonic() - started
+        get_metrics().observe(STAGE_LLM, latency)
+        self._counters.inc("miss" if use_cache else "bypass")
+        # Anche le chiamate senza cache aggiornano la voce, così la variante più recente è quella riusata.
+        if text:
+            self._cache.set(key, {"text": text, "latency": latency}, expire=self.ttl)
+        return text
+
+    def clear(self):
+        self._cache.clear()
+
+
+def get_llm_cache():
+    global _llm_cache
+    if _llm_cache is None:
+        _llm_cache = LlmResponseCache()
+    return _llm_cache
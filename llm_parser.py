@@ -0,0 +1,94 @@
+# llm_parser.py
+import re
+from collections import namedtuple
+from urllib.parse import urlparse
+
+CompanyRecord = namedtuple("CompanyRecord", ["name", "site", "domain"])
+
+# Pattern compilati una volta sola e provati nell'ordine in cui sono definiti.
+LIST_MARKER_PATTERN = re.compile(r"^\s*(?:[-*•]+|\d+[.)])\s+")
+MARKDOWN_LINK_PATTERN = re.compile(r"\s*(.+?)\s*[-–—:]\s*\[.*?\]\((https?://[^)\s]+)\)")
+URL_PATTERN = re.compile(r"\s*(.+?)\s*[-–—:]\s*(https?://\S+)")
+WWW_PATTERN = re.compile(r"\s*(.+?)\s*[-–—:]\s*(www\.\S+)", re.IGNORECASE)
+MARKDOWN_ONLY_PATTERN = re.compile(r"\s*\[(.+?)\]\((https?://[^)\s]+)\)")
+SPACED_DASH_PATTERN = re.compile(r"\s+[-–—]\s+")
+BARE_DOMAIN_PATTERN = re.compile(r"^(https?://)?(www\.)?[a-zA-Z0-9\-.]+\.[a-z]{2,}", re.IGNORECASE)
+EMPHASIS_CHARS = "*_`\"' "
+SITE_TRAILING_CHARS = ".,;:)]>*_`\"'"
+TEMPLATE_PLACEHOLDER = "<Nome Azienda>"
+TEMPLATE_HEADER_PATTERN = re.compile(r"^\W*nome azienda\W+sito(?: web)?\W*$", re.IGNORECASE)
+SITE_HINT_PATTERN = re.compile(r"https?://|www\.|[\w-]+\.[a-z]{2,}\b", re.IGNORECASE)
+# "Nota: ...", "Ecco le aziende...": la parola dopo il prefisso è minuscola, in "Ecco Digital" no.
+NOTE_PATTERN = re.compile(r"^(?i:nota|note|n\.b\.|disclaimer|ecco)(?::|\s+[a-zàèéìòù])")
+
+
+def _is_noise_line(line):
+    if (not line or line.startswith("---") or "```" in line or TEMPLATE_PLACEHOLDER in line
+            or TEMPLATE_HEADER_PATTERN.match(line)):
+        return True
+    # Le frasi di contorno non hanno né separatore nome-sito né dominio: "Ecco Digital - www.eccodigital.it"
+    # o "Elenco Srl - elencosrl.it" sono aziende.
+    if SPACED_DASH_PATTERN.search(line) or SITE_HINT_PATTERN.search(line):
+        return False
+    return line.endswith(":") or bool(NOTE_PATTERN.match(line)) or "elenco di" in line.lower()
+
+
+def _clean_name(name):
+    return name.strip().strip(EMPHASIS_CHARS).strip()
+
+
+def _clean_site(site):
+    site = site.strip().rstrip(SITE_TRAILING_CHARS)
+    return site if site.lower().startswith(("http://", "https://")) else "https://" + site
+
+
+def site_domain(site):
+    """
+    Dominio normalizzato usato come chiave di deduplicazione (minuscolo, senza "www.").
+    Accetta anche domini senza schema ("x.it", come nei JSON dei risultati); None se non è un dominio.
+    """
+    if not isinstance(site, str) or not site.strip():
+        return None
+    site = site.strip()
+    if "//" not in site:
+        site = "//" + site
+    try:
+        domain = urlparse(site).netloc.lower().replace("www.", "")
+    except ValueError:
+        return None
+    return domain if domain and not any(c.isspace() for c in domain) else None
+
+
+def parse_company_line(line):
+    """Interpreta una riga "Nome - Sito"; restituisce None per le righe da ignorare. Il sito può mancare."""
+    line = line.strip()
+    if _is_noise_line(line):
+        return None
+    line = LIST_MARKER_PATTERN.sub("", line, count=1)
+
+    match = (MARKDOWN_LINK_PATTERN.match(line) or URL_PATTERN.match(line) or WWW_PATTERN.match(line)
+             or MARKDOWN_ONLY_PATTERN.match(line))
+    if match:
+        name, site = _clean_name(match.group(1)), _clean_site(match.group(2))
+    else:
+        # "Nome - dominio.it": si divide sul trattino spaziato, così "Tech-Lab Srl" resta un nome intero.
+        parts = SPACED_DASH_PATTERN.split(line, maxsplit=1)
+        if len(parts) == 1 and "-" in line and BARE_DOMAIN_PATTERN.match(line.split("-", 1)[1].strip()):
+            parts = line.split("-", 1)
+        name, raw_site = _clean_name(parts[0]), (parts[1].strip() if len(parts) > 1 else "")
+        site = _clean_site(raw_site.split()[0]) if raw_site and BARE_DOMAIN_PATTERN.match(raw_site) else None
+
+    if not name:
+        return None
+    domain = site_domain(site) if site else None
+    if site and not domain:
+        site = None
+    return CompanyRecord(name, site, domain)
+
+
+def parse_company_lines(llm_output):
+    """Generatore di CompanyRecord(name, site, domain) per ogni riga utile dell'output LLM."""
+    for line in (llm_output or "").splitlines():
+        record = parse_company_line(line)
+        if record:
+            yield record
@@ -0,0 +1,96 @@
+# log_sink.py
+import logging
+import os
+import threading
+import time
+from collections import deque
+from logging.handlers import RotatingFileHandler
+
+LOG_BUFFER_LINES = 500  # Righe tenute in memoria per sessione; le più vecchie escono dal buffer.
+UI_LOG_LINES = 75
+UI_REFRESH_SECONDS = 0.5
+LOG_FILE_PATH = ".cache/logs/ricerca.log"
+LOG_FILE_MAX_BYTES = 5 * 1024 * 1024
+LOG_FILE_BACKUPS = 3
+
+# Prefissi dei messaggi già in uso nel codice, per assegnare un livello a chi chiama log_func(messaggio).
+LEVEL_PREFIXES = (
+    (("⛔",), logging.ERROR),
+    (("⚠️", "⏱️", "🪦"), logging.WARNING),
+    (("Debug", "Google"), logging.DEBUG),
+)
+
+_file_logger = None
+
+
+def infer_level(message):
+    for prefixes, level in LEVEL_PREFIXES:
+        if message.startswith(prefixes):
+            return level
+    return logging.INFO
+
+
+def get_file_logger(path=LOG_FILE_PATH):
+    """Logger su file a rotazione, condiviso da tutte le sessioni; non propaga al logger root."""
+    global _file_logger
+    if _file_logger is None:
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        logger = logging.getLogger("trova_clienti.ricerca")
+        logger.setLevel(logging.DEBUG)
+        logger.propagate = False
+        handler = RotatingFileHandler(path, maxBytes=LOG_FILE_MAX_BYTES, backupCount=LOG_FILE_BACKUPS,
+                                      encoding="utf-8")
+        handler.setFormatter(logging.Formatter("%(asctime)s %(levelname)s [%(threadName)s] %(message)s"))
+        logger.addHandler(handler)
+        _file_logger = logger
+    return _file_logger
+
+
+class LogSink:
+    """
+    Log di una sessione: ogni riga va sul file di log, quelle da ui_level in su anche in un buffer
+    circolare di max_lines righe mostrato nell'app. render() ridisegna il widget al massimo una volta
+    ogni refresh_interval secondi e solo se sono arrivate righe nuove. log() è sicuro dai thread.
+    """
+
+    def __init__(self, max_lines=LOG_BUFFER_LINES, ui_level=logging.INFO, refresh_interval=UI_REFRESH_SECONDS,
+                 file_logger=None):
+        self.ui_level = ui_level
+        self.refresh_interval = refresh_interval
+        self.file_logger = file_logger or get_file_logger()
+        self._lines = deque(maxlen=max_lines)
+        self._lock = threading.Lock()
+        self._version, self._rendered_version, self._last_render = 0, -1, 0.0
+
+    def log(self, message, level=None, source="THR"):
+        level = infer_level(message) if level is None else level
+        self.file_logger.log(level, f"({source}) {message}")
+        if level < self.ui_level:
+            return
+        line = f"- {time.strftime('%H:%M:%S')}({source}): {message}"
+        with self._lock:
+            self._lines.append(line)
+            self._version += 1
+
+    def ui(self, message, level=None):
+        self.log(message, level, source="UI")
+
+    def tail(self, n=UI_LOG_LINES):
+        with self._lock:
+            return list(self._lines)[-n:]
+
+    def render(self, container, force=False):
+        """Aggiorna container con le ultime UI_LOG_LINES righe; force ignora limite di frequenza e righe nuove."""
+        now = time.monotonic()
+        with self._lock:
+            if not force and (self._version == self._rendered_version or now - self._last_render < self.refresh_interval):
+                return False
+            lines = list(self._lines)[-UI_LOG_LINES:]
+            self._rendered_version, self._last_render = self._version, now
+        container.markdown("\n".join(lines), unsafe_allow_html=True)
+        return True
+
+    def clear(self):
+        with self._lock:
+            self._lines.clear()
+            self._version += 1
@@ -0,0 +1,227 @@
+# metrics.py
+import bisect
+import contextvars
+import functools
+import json
+import threading
+import time
+from contextlib import contextmanager
+
+METRICS_PREFIX = "scraper"
+# Limiti superiori dei bucket (secondi), come negli istogrammi Prometheus.
+LATENCY_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+# Fasi misurate lungo la ricerca.
+STAGE_LLM = "llm"                       # chiamata effettiva al modello (le risposte in cache non contano)
+STAGE_SITE_SEARCH = "ricerca_sito"      # ricerca nome -> sito sul motore di ricerca
+STAGE_DNS = "dns"                       # singola risoluzione DNS (non in cache)
+STAGE_HTTP = "http"                     # singolo tentativo HTTP, corpo compreso
+STAGE_HTML_PARSE = "parsing_html"       # HTML -> testo + link mailto
+STAGE_EMAIL_VALIDATION = "validazione_email"
+STAGE_COMPANY = "azienda"               # scraping completo di un'azienda
+STAGE_EMAIL_SEND = "invio_email"        # singola chiamata Gmail messages().send
+
+_metrics = None
+# Registro della ricerca in corso nel contesto corrente (thread o task asyncio); None = quello di processo.
+_current_metrics = contextvars.ContextVar("current_metrics", default=None)
+
+
+class Histogram:
+    """Istogramma a bucket fissi con conteggio, somma e massimo; i percentili sono stimati dai bucket."""
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # L'ultimo raccoglie i valori oltre l'ultimo limite (+Inf).
+        self.count, self.total, self.max = 0, 0.0, 0.0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.total += value
+        self.max = max(self.max, value)
+
+    def quantile(self, fraction):
+        """Limite superiore del bucket che contiene il percentile richiesto (il massimo se oltre l'ultimo)."""
+        if not self.count:
+            return 0.0
+        rank, cumulative = fraction * self.count, 0
+        for upper, bucket_count in zip(self.buckets, self.counts):
+            cumulative += bucket_count
+            if cumulative >= rank:
+                return min(upper, self.max)
+        return self.max
+
+    def merge(self, snapshot):
+        """Somma un Histogram.snapshot() prodotto altrove (es. in un processo di parsing)."""
+        for index, bucket_count in enumerate(snapshot["buckets"].values()):
+            self.counts[index] += bucket_count
+        self.count += snapshot["count"]
+        self.total += snapshot["sum"]
+        self.max = max(self.max, snapshot["max"])
+
+    def snapshot(self):
+        return {"count": self.count, "sum": round(self.total, 6), "max": round(self.max, 6),
+                "p50": round(self.quantile(0.5), 6), "p95": round(self.quantile(0.95), 6),
+                "buckets": dict(zip([str(b) for b in self.buckets] + ["+Inf"], self.counts))}
+
+
+class StatCounters:
+    """Contatori thread-safe delle statistiche di una cache (hit, miss, ...), azzerati a inizio ricerca."""
+
+    def __init__(self, *names):
+        self._names = names
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self._values = dict.fromkeys(self._names, 0)
+
+    def inc(self, name, value=1):
+        with self._lock:
+            self._values[name] += value
+
+    def snapshot(self):
+        with self._lock:
+            return dict(self._values)
+
+
+def hit_rate(hits, total):
+    return round(hits / total, 3) if total else 0.0
+
+
+class MetricsRegistry:
+    """
+    Metriche di processo, thread-safe: istogrammi di latenza per fase, contatori (byte scaricati,
+    retry, domini bloccati, ...) e gauge (limiti di concorrenza attuali). snapshot() le restituisce
+    come dizionario, to_json() e to_prometheus() nei due formati leggibili da programmi esterni.
+    """
+
+    def __init__(self, prefix=METRICS_PREFIX):
+        self.prefix = prefix
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self._histograms, self._counters, self._gauges = {}, {}, {}
+            self.started_at = time.time()
+
+    def observe(self, stage, seconds):
+        with self._lock:
+            histogram = self._histograms.get(stage)
+            if histogram is None:
+                histogram = self._histograms[stage] = Histogram()
+            histogram.observe(seconds)
+
+    @contextmanager
+    def timer(self, stage):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(stage, time.perf_counter() - started)
+
+    def inc(self, name, value=1):
+        with self._lock:
+            self._counters[name] = self._counters.get(name, 0) + value
+
+    def counter(self, name):
+        with self._lock:
+            return self._counters.get(name, 0)
+
+    def merge(self, snapshot):
+        """
+        Aggiunge istogrammi e contatori di un snapshot() preso in un altro processo, dove get_metrics()
+        è un registro diverso da questo. I gauge restano quelli del processo corrente.
+        """
+        with self._lock:
+            for stage, histogram_snapshot in snapshot["stages"].items():
+                histogram = self._histograms.get(stage)
+                if histogram is None:
+                    histogram = self._histograms[stage] = Histogram()
+                histogram.merge(histogram_snapshot)
+            for name, value in snapshot["counters"].items():
+                self._counters[name] = self._counters.get(name, 0) + value
+
+    def set_gauge(self, name, value):
+        """Valore istantaneo (es. limite di concorrenza attuale): ogni chiamata sovrascrive la precedente."""
+        with self._lock:
+            self._gauges[name] = value
+
+    def snapshot(self):
+        with self._lock:
+            return {"started_at": self.started_at, "elapsed_s": round(time.time() - self.started_at, 3),
+                    "stages": {stage: h.snapshot() for stage, h in sorted(self._histograms.items())},
+                    "counters": dict(sorted(self._counters.items())), "gauges": dict(sorted(self._gauges.items()))}
+
+    def to_json(self):
+        return json.dumps(self.snapshot(), ensure_ascii=False, indent=2)
+
+    def to_prometheus(self):
+        snapshot = self.snapshot()
+        stage_metric = f"{self.prefix}_stage_seconds"
+        lines = [f"# HELP {stage_metric} Durata delle fasi della ricerca.", f"# TYPE {stage_metric} histogram"]
+        for stage, histogram in snapshot["stages"].items():
+            cumulative = 0
+            for upper, bucket_count in histogram["buckets"].items():
+                cumulative += bucket_count
+                lines.append(f'{stage_metric}_bucket{{stage="{stage}",le="{upper}"}} {cumulative}')
+            lines.append(f'{stage_metric}_sum{{stage="{stage}"}} {histogram["sum"]}')
+            lines.append(f'{stage_metric}_count{{stage="{stage}"}} {histogram["count"]}')
+        for name, value in snapshot["counters"].items():
+            metric = f"{self.prefix}_{name}_total"
+            lines += [f"# TYPE {metric} counter", f"{metric} {value}"]
+        for name, value in snapshot["gauges"].items():
+            metric = f"{self.prefix}_{name}"
+            lines += [f"# TYPE {metric} gauge", f"{metric} {value}"]
+        return "\n".join(lines) + "\n"
+
+    def summary_rows(self):
+        """Una riga per fase (conteggio, totale, p50/p95/max in ms) per la tabella di debug dell'app."""
+        snapshot = self.snapshot()
+        return [{"fase": stage, "conteggio": h["count"], "totale_s": round(h["sum"], 2),
+                 "p50_ms": round(h["p50"] * 1000, 1), "p95_ms": round(h["p95"] * 1000, 1),
+                 "max_ms": round(h["max"] * 1000, 1)}
+                for stage, h in snapshot["stages"].items()]
+
+
+def get_metrics():
+    """Registro della ricerca attiva nel contesto corrente (use_metrics), altrimenti quello di processo."""
+    current = _current_metrics.get()
+    if current is not None:
+        return current
+    global _metrics
+    if _metrics is None:
+        _metrics = MetricsRegistry()
+    return _metrics
+
+
+@contextmanager
+def use_metrics(registry):
+    """Nel blocco, get_metrics() restituisce registry: così ogni ricerca misura solo il proprio lavoro."""
+    token = _current_metrics.set(registry)
+    try:
+        yield registry
+    finally:
+        _current_metrics.reset(token)
+
+
+def bind_metrics(fn, registry=None):
+    """
+    fn che gira con registry (default: il registro attivo adesso). I thread e i pool non ereditano il
+    contesto di chi li crea, quindi le funzioni passate a Thread/executor vanno legate qui.
+    """
+    registry = registry or get_metrics()
+
+    @functools.wraps(fn)
+    def bound(*args, **kwargs):
+        with use_metrics(registry):
+            return fn(*args, **kwargs)
+    return bound
+
+
+async def run_with_metrics(registry, coro):
+    """Esegue coro (e i task che crea) con registry come registro attivo."""
+    with use_metrics(registry):
+        return await coro
@@ -0,0 +1,67 @@
+# parse_pool.py
+import asyncio
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from dotenv import load_dotenv
+from extraction import extract_emails_and_piva
+from contact_discovery import rank_contact_links
+from metrics import get_metrics
+
+load_dotenv()
+
+MAX_PARSE_WORKERS = os.cpu_count() or 1
+# Stadio opzionale, spento di default: PARSE_WORKERS=4 nel file .env lo attiva con 4 processi.
+PARSE_WORKERS = int(os.getenv("PARSE_WORKERS", "0"))
+# Sotto questa dimensione la pagina si analizza nel loop: serializzarla verso un processo costa più del parsing.
+PARSE_POOL_MIN_CHARS = 16 * 1024
+STAGE_PARSE_POOL = "parsing_processi"  # attesa complessiva lato motore, coda del pool compresa
+
+
+def analyze_page(html_text, url, contact_links_limit=0):
+    """(email, P.IVA, link ai contatti): tutto il lavoro CPU su una pagina, eseguibile in un processo separato."""
+    emails, piva = extract_emails_and_piva(html_text, url)
+    links = rank_contact_links(html_text, url, contact_links_limit) if contact_links_limit else []
+    return emails, piva, links
+
+
+def _analyze_page_in_process(html_text, url, contact_links_limit):
+    """
+    analyze_page in un processo del pool. Le metriche registrate lì (parsing_html, validazione_email)
+    finirebbero nel registro del processo figlio: tornano al chiamante insieme al risultato.
+    """
+    metrics = get_metrics()
+    metrics.reset()
+    result = analyze_page(html_text, url, contact_links_limit)
+    return result, metrics.snapshot()
+
+
+class ParsePool:
+    """
+    Stadio di parsing opzionale per AsyncFetchEngine: le pagine grandi vengono analizzate in un
+    ProcessPoolExecutor (di default un processo per core), così lxml e le regex non competono per il
+    GIL con l'event loop che gestisce le richieste. I processi usano "spawn": l'app ha già diversi
+    thread attivi.
+    """
+
+    def __init__(self, workers=MAX_PARSE_WORKERS, min_chars=PARSE_POOL_MIN_CHARS):
+        self.workers = workers
+        self.min_chars = min_chars
+        self._executor = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"))
+
+    async def analyze(self, html_text, url, contact_links_limit=0):
+        if not html_text or len(html_text) < self.min_chars:
+            return analyze_page(html_text, url, contact_links_limit)
+        started = time.perf_counter()
+        try:
+            result, child_metrics = await asyncio.get_running_loop().run_in_executor(
+                self._executor, _analyze_page_in_process, html_text, url, contact_links_limit)
+            get_metrics().merge(child_metrics)
+            return result
+        finally:
+            get_metrics().observe(STAGE_PARSE_POOL, time.perf_counter() - started)
+
+    def close(self):
+        self._executor.shutdown(wait=True, cancel_futures=True)
@@ -0,0 +1,396 @@
+# pipeline.py
+import queue
+import threading
+import time
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor, as_completed, wait, FIRST_COMPLETED
+
+from scraping import create_fetch_engine, extract_emails_from_url_async, get_http_cache, get_domain_health_registry
+from utils_llm import call_gemini_flash
+from llm_cache import get_llm_cache
+from llm_parser import parse_company_lines, site_domain
+from site_resolver import get_site_resolver
+from dns_prefilter import get_dns_prefilter
+from run_store import get_run_store
+from lead_store import get_lead_store, DUPLICATE_PIVA
+from metrics import MetricsRegistry, use_metrics, bind_metrics, STAGE_COMPANY
+
+# Campi dei record, identici a quelli dei download JSON "Utili" e "Scarti".
+RESULT_FIELDS = ["Nome Azienda", "Sito Web", "Email trovate", "P.IVA Trovata", "Stato"]
+LLM_PREFETCH_BATCHES = 1  # Batch LLM già pronti in coda mentre si fa scraping di quello corrente.
+MAX_LLM_ITERATIONS = 15
+# Budget fisso (token stimati) per i nomi da escludere nel prompt: entrano solo i più recenti,
+# tutti gli altri duplicati vengono scartati localmente (identificatori della ricerca + archivio lead).
+PROMPT_EXCLUSION_TOKEN_BUDGET = 250
+CHARS_PER_TOKEN = 4  # Stima grossolana ma stabile per l'italiano con il tokenizer di Gemini.
+
+# Dizionario dei modelli LLM disponibili (funzione(prompt, use_cache=True) -> testo)
+LLM_MODELS = {
+    "Gemini_Flash_2_0": call_gemini_flash,
+    # Aggiungi qui altri modelli LLM se ne hai (es. "OpenAI GPT-3.5": call_openai_gpt35)
+    # Esempio: "Altro Modello": another_llm_function,
+}
+DEFAULT_LLM_MODELS = ["Gemini_Flash_2_0"]
+# Timeout per singolo modello (secondi); i modelli non elencati usano quello di default.
+LLM_MODEL_TIMEOUTS = {
+    "Gemini_Flash_2_0": 30,
+}
+DEFAULT_LLM_MODEL_TIMEOUT = 45
+
+# kind: "restored" (risultato recuperato da un checkpoint), "batch" (nuovo batch LLM), "result" (azienda
+# classificata), "batch_end" (batch concluso), "target_reached" (obiettivo raggiunto, aziende in corso annullate).
+PipelineEvent = namedtuple("PipelineEvent", ["kind", "iteration", "record", "useful", "count"])
+
+
+def estimate_tokens(text):
+    return (len(text) + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN
+
+
+def bounded_exclusion_names(names, token_budget=PROMPT_EXCLUSION_TOKEN_BUDGET):
+    """Nomi (dal più recente) che stanno nel budget di token, senza duplicati."""
+    selected, used_tokens, seen = [], 0, set()
+    for name in names:
+        key = name.lower()
+        if key in seen:
+            continue
+        cost = estimate_tokens(name + ", ")
+        if used_tokens + cost > token_budget:
+            break
+        selected.append(name)
+        seen.add(key)
+        used_tokens += cost
+    return selected
+
+
+def generate_company_list_prompt(settore, regione, dimensione, exclude_names, num_results,
+                                 exclude_token_budget=PROMPT_EXCLUSION_TOKEN_BUDGET):
+    # exclude_names va passato dal più recente: oltre il budget i nomi più vecchi restano fuori dal prompt.
+    exclude_names = bounded_exclusion_names(exclude_names, exclude_token_budget)
+    exclude_str = ", ".join(exclude_names) if exclude_names else "nessuno"
+    return (
+        f"Elenca {num_results} piccole aziende italiane di {settore.lower()}, <{dimensione} dipendenti, in {regione}. Includi sito web (formato: www.esempio.it o https://www.esempio.it). Evita questi nomi: {exclude_str}.\nFormato: Nome - Sito\nEsempio:\nABC Formazione - www.abcformazione.it")
+
+
+def iter_llm_outputs(prompt, model_names, log_func_thread_safe, use_cache=True):
+    """
+    Interroga in parallelo i modelli selezionati e restituisce (nome_modello, output) man mano che arrivano.
+    Chi supera il proprio timeout viene abbandonato; se il chiamante smette di iterare,
+    le risposte ancora in attesa vengono ignorate.
+    """
+    executor = ThreadPoolExecutor(max_workers=max(1, len(model_names)), thread_name_prefix="llm")
+    model_by_future, deadlines = {}, {}
+    started = time.monotonic()
+    for model_name in model_names:
+        llm_function = LLM_MODELS.get(model_name)
+        if not llm_function:
+            log_func_thread_safe(f"⚠️ Modello LLM '{model_name}' non trovato o non implementato.")
+            continue
+        future = executor.submit(bind_metrics(llm_function), prompt, use_cache=use_cache)
+        model_by_future[future] = model_name
+        deadlines[future] = started + LLM_MODEL_TIMEOUTS.get(model_name, DEFAULT_LLM_MODEL_TIMEOUT)
+    pending = set(model_by_future)
+    try:
+        while pending:
+            now = time.monotonic()
+            for expired in [f for f in pending if deadlines[f] <= now]:
+                pending.discard(expired)
+                log_func_thread_safe(f"⏱️ Timeout LLM '{model_by_future[expired]}' dopo {now - started:.1f}s.")
+            if not pending: break
+            done, pending = wait(pending, timeout=min(deadlines[f] for f in pending) - now,
+                                 return_when=FIRST_COMPLETED)
+            for future in done:
+                model_name = model_by_future[future]
+                try:
+                    output_llm = future.result()
+                except Exception as e:
+                    log_func_thread_safe(f"⛔ Errore LLM '{model_name}': {e}.")
+                    continue
+                log_func_thread_safe(
+                    f"Debug LLM '{model_name}': Output ricevuto in {time.monotonic() - started:.1f}s. Lunghezza: {len(output_llm) if output_llm else 0} caratteri.")
+                yield model_name, output_llm or ""
+    finally:
+        executor.shutdown(wait=False, cancel_futures=True)
+
+
+def make_result(name, site, emails, p_iva, status):
+    return {"Nome Azienda": name, "Sito Web": site_domain(site) or site,
+            "Email trovate": ", ".join(emails) if emails else "Nessuna",
+            "P.IVA Trovata": "Sì" if p_iva else "No", "Stato": status}
+
+
+class SearchPipeline:
+    """
+    Ricerca completa senza Streamlit: prompt -> LLM -> parsing -> risoluzione siti -> prefiltro DNS
+    -> scraping -> classificazione. run() è un generatore di PipelineEvent; i risultati restano anche
+    in self.utili e self.scartati. Smettere di iterare (o chiamare stop()) ferma il produttore LLM.
+    Ogni ricerca ha un run_id con checkpoint incrementali (run_store): from_checkpoint() la riprende
+    senza rifare lo scraping delle aziende già concluse. Con skip_known_leads le aziende già presenti
+    nell'archivio lead (ricerche precedenti) vengono saltate ed escluse dal prompt.
+    Le metriche finiscono in self.metrics, un registro per ricerca (anche passato da fuori).
+    """
+
+    def __init__(self, settore, regione, dimensione, max_results, models=None, use_llm_cache=True, engine=None,
+                 log_func=None, max_llm_iterations=MAX_LLM_ITERATIONS, run_store=None, run_id=None,
+                 skip_known_leads=True, lead_store=None, metrics=None):
+        self.settore, self.regione, self.dimensione, self.max_results = settore, regione, dimensione, max_results
+        self.models = list(models or DEFAULT_LLM_MODELS)
+        self.use_llm_cache = use_llm_cache
+        self.skip_known_leads = skip_known_leads
+        self.max_llm_iterations = max_llm_iterations
+        self.log = log_func or print
+        self.engine = engine
+        # Registro proprio: con più sessioni Streamlit in parallelo le ricerche non si mescolano le metriche.
+        self.metrics = metrics or MetricsRegistry()
+        self.utili, self.scartati = [], []
+        self.domain_health = get_domain_health_registry()
+        self.site_resolver = get_site_resolver()
+        self.dns_prefilter = get_dns_prefilter()
+        self._processed_identifiers = set()
+        self._seen_names = []  # Nomi in ordine di arrivo, per la finestra di esclusione del prompt.
+        self._sent_prompts = set()  # Prompt già inviati in questa ricerca: se si ripetono, niente cache.
+        self._identifiers_lock = threading.Lock()
+        self.prompt_stats = []
+        self._batch_queue = queue.Queue(maxsize=LLM_PREFETCH_BATCHES)
+        self._stop = threading.Event()
+        self._restored_results, self._pending_companies, self._start_iteration = [], [], 0
+        self.lead_store = lead_store or get_lead_store()
+        self.known_leads_skipped, self.piva_duplicates = 0, 0
+        self._known_lead_names = self.lead_store.recent_names(settore, regione) if skip_known_leads else []
+        self.run_store = run_store or get_run_store()
+        if run_id is None:
+            self.run_id = self.run_store.create_run(self.params())
+        else:
+            self.run_id = run_id
+            self._restore(run_id)
+
+    @classmethod
+    def from_checkpoint(cls, run_id, run_store=None, **kwargs):
+        """Riprende una ricerca salvata con i suoi parametri originali; None se il run_id non esiste."""
+        run_store = run_store or get_run_store()
+        saved_run = run_store.get_run(run_id)
+        if saved_run is None:
+            return None
+        params = saved_run["params"]
+        return cls(params["settore"], params["regione"], params["dimensione"], params["max_results"],
+                   models=params["models"], use_llm_cache=params["use_llm_cache"], run_store=run_store,
+                   run_id=run_id, skip_known_leads=params.get("skip_known_leads", True), **kwargs)
+
+    def params(self):
+        return {"settore": self.settore, "regione": self.regione, "dimensione": self.dimensione,
+                "max_results": self.max_results, "models": self.models, "use_llm_cache": self.use_llm_cache,
+                "skip_known_leads": self.skip_known_leads}
+
+    def _restore(self, run_id):
+        saved_run = self.run_store.get_run(run_id)
+        self._start_iteration = saved_run["llm_iterations"] if saved_run else 0
+        identifiers, self._pending_companies, self._restored_results = self.run_store.load_companies(run_id)
+        self._processed_identifiers.update(identifiers)
+        self._seen_names.extend(name for name, _ in identifiers)
+
+    def stop(self):
+        self._stop.set()
+
+    def stats(self):
+        return {"domini": self.domain_health.state_counts(), "cache_http": get_http_cache().stats(self.metrics),
+                "cache_llm": get_llm_cache().stats(), "siti": self.site_resolver.stats(),
+                "dns": self.dns_prefilter.stats(),
+                "concorrenza": self.engine.concurrency_stats() if self.engine else None,
+                "lead": {"gia_noti_saltati": self.known_leads_skipped, "duplicati_piva": self.piva_duplicates,
+                         "in_archivio": self.lead_store.count()},
+                "prompt": self._prompt_summary()}
+
+    def _record_prompt_stats(self, llm_iteration, prompt, seen_names, latency, new_companies):
+        entry = {"iterazione": llm_iteration, "caratteri": len(prompt), "token_stimati": estimate_tokens(prompt),
+                 "nomi_visti": seen_names, "latenza_s": round(latency, 2), "aziende_nuove": new_companies}
+        self.prompt_stats.append(entry)
+        self.log(f"📏 Prompt {llm_iteration}: {entry['caratteri']} caratteri (~{entry['token_stimati']} token), "
+                 f"{seen_names} nomi già visti, LLM {entry['latenza_s']}s, {new_companies} aziende nuove.")
+
+    def _prompt_summary(self):
+        if not self.prompt_stats:
+            return {"iterazioni": 0}
+        tokens = [p["token_stimati"] for p in self.prompt_stats]
+        latencies = [p["latenza_s"] for p in self.prompt_stats]
+        return {"iterazioni": len(self.prompt_stats), "token_medi": round(sum(tokens) / len(tokens)),
+                "token_max": max(tokens), "latenza_media_s": round(sum(latencies) / len(latencies), 2),
+                "latenza_max_s": max(latencies)}
+
+    def _put_batch(self, item):
+        while not self._stop.is_set():
+            try:
+                self._batch_queue.put(item, timeout=0.2); return True
+            except queue.Full:
+                continue
+        return False
+
+    def _parse_llm_output_into(self, output_llm, companies_from_llm):
+        # Aggiunge le aziende non ancora viste; i nomi senza sito vengono risolti tutti insieme,
+        # in parallelo e con cache, invece che uno alla volta dentro il ciclo.
+        records = list(parse_company_lines(output_llm))
+        resolved_sites = self.site_resolver.resolve_many([r.name for r in records if not r.site], self.log)
+        candidates = []
+        for record in records:
+            site_str, domain = record.site, record.domain
+            if not site_str:
+                site_str = resolved_sites.get(record.name)
+                domain = site_domain(site_str) if site_str else None
+            if domain: candidates.append((record.name, site_str, domain))
+        # Aziende già trovate in ricerche precedenti: escluse dai prossimi prompt ma mai visitate di nuovo.
+        known_domains = self.lead_store.known_domains(d for _, _, d in candidates) if self.skip_known_leads else set()
+        new_companies = []
+        for name, site_str, domain in candidates:
+            identifier = (name.lower(), domain)
+            with self._identifiers_lock:
+                if identifier in self._processed_identifiers: continue
+                self._processed_identifiers.add(identifier)
+                self._seen_names.append(name.lower())
+                if domain in known_domains:
+                    self.known_leads_skipped += 1; continue
+                companies_from_llm.append((name, site_str))
+            new_companies.append((name, site_str, domain))
+            if len(companies_from_llm) >= self.max_results + 5: break # Un po' di margine per il parsing
+        if new_companies: self.run_store.add_companies(self.run_id, new_companies)
+
+    def _produce_company_batches(self):
+        # Produttore: chiama gli LLM e interpreta le liste mentre il consumatore fa scraping
+        # del batch precedente. È l'unico a scrivere _processed_identifiers, quindi l'esclusione resta corretta.
+        llm_iteration, no_new_company_batches = self._start_iteration, 0
+        try:
+            while (self._pending_companies or llm_iteration < self.max_llm_iterations) and not self._stop.is_set():
+                if self._pending_companies:
+                    # Ripresa: prima le aziende già proposte ma mai visitate, senza nuove chiamate LLM.
+                    companies_from_llm, self._pending_companies = self._pending_companies, []
+                    self.log(f"♻️ Ripresa {self.run_id}: {len(companies_from_llm)} aziende in sospeso.")
+                else:
+                    llm_iteration += 1
+                    with self._identifiers_lock:
+                        excluded_names = self._seen_names[::-1]
+                    excluded_names += [n.lower() for n in self._known_lead_names]
+                    prompt = generate_company_list_prompt(self.settore, self.regione, self.dimensione,
+                                                          excluded_names, self.max_results)
+
+                    # Un giro senza aziende nuove lascia il prompt invariato: dalla cache tornerebbe la stessa
+                    # risposta fino allo stallo, quindi la cache vale solo la prima volta che un prompt parte.
+                    use_cache = self.use_llm_cache and prompt not in self._sent_prompts
+                    self._sent_prompts.add(prompt)
+                    companies_from_llm, llm_output_received = [], False
+                    llm_started = time.monotonic()
+                    for model_name, output_llm in iter_llm_outputs(prompt, self.models, self.log, use_cache):
+                        llm_output_received = llm_output_received or bool(output_llm.strip())
+                        self._parse_llm_output_into(output_llm, companies_from_llm)
+                        # Abbastanza candidati nuovi: non si aspetta il modello più lento.
+                        if len(companies_from_llm) >= self.max_results + 5: break
+                    self._record_prompt_stats(llm_iteration, prompt, len(excluded_names), time.monotonic() - llm_started,
+                                              len(companies_from_llm))
+                    self.run_store.set_llm_iterations(self.run_id, llm_iteration)
+
+                    if not llm_output_received: self.log("⚠️ Output LLM vuoto."); time.sleep(0.5); continue
+
+                    if not companies_from_llm:
+                        no_new_company_batches += 1
+                    else:
+                        no_new_company_batches = 0
+                    if no_new_company_batches >= 3: self.log("⚠️ Stallo LLM."); break
+                    if not companies_from_llm: time.sleep(0.5); continue
+                if self._stop.is_set(): break
+                # I domini che non risolvono nel DNS vengono scartati prima di qualsiasi richiesta HTTP.
+                try:
+                    alive_companies, dead_companies = self.engine.submit(
+                        self.dns_prefilter.filter_companies(companies_from_llm)).result()
+                except Exception as e_dns:
+                    self.log(f"⚠️ Prefiltro DNS non disponibile: {e_dns}")
+                    alive_companies, dead_companies = companies_from_llm, []
+                if dead_companies: self.log(
+                    f"🪦 DNS: {len(dead_companies)} domini inesistenti scartati prima dello scraping.")
+                if not self._put_batch((llm_iteration, alive_companies, dead_companies)): break
+        except Exception as e_prod:
+            self.log(f"⛔ Errore produttore LLM: {e_prod}")
+        finally:
+            self._put_batch(None)  # Segnala al consumatore che non arriveranno altri batch.
+
+    async def _process_company(self, name, site):
+        with self.metrics.timer(STAGE_COMPANY):
+            emails, p_iva, status = await extract_emails_from_url_async(site, self.domain_health, self.engine)
+        return make_result(name, site, emails, p_iva, status), bool(emails), emails, p_iva
+
+    def _classify(self, name, site, record, useful, emails=(), piva=None):
+        domain = site_domain(site)
+        lead_status = self.lead_store.upsert_lead(domain, name, site, emails, piva if isinstance(piva, str) else None,
+                                                  useful, self.settore, self.regione, self.run_id)
+        if lead_status == DUPLICATE_PIVA:
+            self.piva_duplicates += 1
+            if useful and self.skip_known_leads:
+                # Stessa azienda già trovata con un altro dominio: non va contattata due volte.
+                record = {**record, "Stato": f"Già nota (stessa P.IVA). {record['Stato']}"}
+                useful = False
+        (self.utili if useful else self.scartati).append(record)
+        self.metrics.inc("aziende_utili" if useful else "aziende_scartate")
+        self.run_store.record_result(self.run_id, name, domain, record, useful)
+        return record, useful
+
+    def run(self):
+        get_llm_cache().reset_stats()
+        self.site_resolver.reset_stats()
+        self.dns_prefilter.reset_stats()
+        self.metrics.reset()
+        owns_engine = self.engine is None
+        if owns_engine:
+            self.engine = create_fetch_engine()
+
+        for record, useful in self._restored_results:
+            (self.utili if useful else self.scartati).append(record)
+            yield PipelineEvent("restored", self._start_iteration, record, useful, len(self.utili))
+        self._restored_results = []
+
+        # Il produttore (e le coroutine che sottomette al motore) registra nelle metriche di questa ricerca.
+        producer_thread = threading.Thread(target=bind_metrics(self._produce_company_batches, self.metrics),
+                                           name="llm-producer", daemon=True)
+        producer_thread.start()
+        try:
+            while len(self.utili) < self.max_results:
+                try:
+                    batch_item = self._batch_queue.get(timeout=0.5)
+                except queue.Empty:
+                    continue
+                if batch_item is None: break
+                llm_iteration, companies, dead_companies = batch_item
+                yield PipelineEvent("batch", llm_iteration, None, None, len(companies))
+
+                for name, site in dead_companies:
+                    record, _ = self._classify(name, site, make_result(name, site, [], None, "DNS: dominio inesistente"),
+                                               False)
+                    yield PipelineEvent("result", llm_iteration, record, False, len(self.utili))
+
+                # Tutte le aziende del batch sono in volo insieme sul motore asincrono condiviso;
+                # i risultati vengono consumati nell'ordine in cui finiscono, non in quello di invio.
+                with use_metrics(self.metrics):
+                    future_to_company = {self.engine.submit(self._process_company(n, s)): (n, s)
+                                         for n, s in companies}
+                for future in as_completed(future_to_company):
+                    name, site = future_to_company[future]
+                    emails, piva = [], None
+                    try:
+                        record, useful, emails, piva = future.result()
+                    except Exception as e_thr:
+                        self.log(f"⛔ Errore thr {name}: {e_thr}")
+                        record = {"Nome Azienda": name, "Sito Web": site_domain(site) or site,
+                                  "Email trovate": "ERR", "P.IVA Trovata": "ERR",
+                                  "Stato": f"Exc: {type(e_thr).__name__}"}
+                        useful = False
+                    record, useful = self._classify(name, site, record, useful, emails, piva)
+                    yield PipelineEvent("result", llm_iteration, record, useful, len(self.utili))
+
+                    if len(self.utili) >= self.max_results:
+                        pending_futures = [pf for pf in future_to_company if not pf.done()]
+                        for pf in pending_futures: pf.cancel()
+                        yield PipelineEvent("target_reached", llm_iteration, None, None, len(pending_futures))
+                        break
+
+                yield PipelineEvent("batch_end", llm_iteration, None, None, len(self.utili))
+                self.domain_health.save()
+            # Conclusa (obiettivo raggiunto o LLM esaurito): non va più proposta per la ripresa.
+            self.run_store.mark_completed(self.run_id)
+        finally:
+            self._stop.set()  # Ferma il produttore anche se il chiamante smette di iterare.
+            if owns_engine:
+                self.engine.close()
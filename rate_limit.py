@@ -0,0 +1,47 @@
+# rate_limit.py
+import threading
+import time
+
+
+class TokenBucket:
+    """
+    Token bucket thread-safe: rate gettoni al secondo, al massimo capacity accumulati (raffica).
+    acquire() blocca finché non c'è un gettone o scade il timeout.
+    """
+
+    def __init__(self, rate, capacity=1):
+        if rate <= 0:
+            raise ValueError("rate deve essere maggiore di zero")
+        self.rate = float(rate)
+        self.capacity = max(1.0, float(capacity))
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self, now):
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def try_acquire(self, tokens=1):
+        with self._lock:
+            self._refill(time.monotonic())
+            if self._tokens >= tokens:
+                self._tokens -= tokens
+                return True
+            return False
+
+    def acquire(self, tokens=1, timeout=None):
+        """Restituisce True se il gettone è stato preso, False se il timeout scade prima."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._refill(now)
+                if self._tokens >= tokens:
+                    self._tokens -= tokens
+                    return True
+                wait_time = (tokens - self._tokens) / self.rate
+            if deadline is not None:
+                if now + wait_time > deadline:
+                    return False
+            time.sleep(wait_time)
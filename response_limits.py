@@ -0,0 +1,109 @@
+# response_limits.py
+import codecs
+import re
+
+from http_cache import CachedResponse
+from metrics import get_metrics
+
+MAX_BODY_BYTES = 2 * 1024 * 1024  # Oltre questa soglia si smette di leggere: memoria e banda per azienda limitate.
+STREAM_CHUNK_SIZE = 64 * 1024
+ALLOWED_CONTENT_TYPES = ("text/html", "application/xhtml+xml", "text/plain", "text/xml", "application/xml")
+DEFAULT_CHARSET = "utf-8"
+CHARSET_SNIFF_BYTES = 2048
+
+CHARSET_PARAM_PATTERN = re.compile(r"charset\s*=\s*[\"']?([\w.:-]+)", re.IGNORECASE)
+META_CHARSET_PATTERN = re.compile(rb"""<meta[^>]+charset\s*=\s*["']?([\w.:-]+)""", re.IGNORECASE)
+
+
+class CappedResponse(CachedResponse):
+    """
+    Risposta letta in streaming entro MAX_BODY_BYTES.
+    truncated: il corpo è stato tagliato alla soglia; skipped: motivo per cui il corpo non è stato letto
+    (tipo di contenuto non testuale o Content-Length oltre la soglia), con text vuoto;
+    body_bytes: byte effettivamente scaricati.
+    """
+
+    def __init__(self, url, status_code, text, headers, truncated=False, skipped=None, body_bytes=0):
+        super().__init__(url, status_code, text, headers)
+        self.truncated = truncated
+        self.skipped = skipped
+        self.body_bytes = body_bytes
+
+
+def _media_type(content_type):
+    return content_type.split(";", 1)[0].strip().lower()
+
+
+def skip_reason(headers, max_bytes=MAX_BODY_BYTES):
+    """Motivo per non scaricare il corpo, deciso dai soli header; None se va letto."""
+    content_type = headers.get("content-type")
+    if content_type and _media_type(content_type) not in ALLOWED_CONTENT_TYPES:
+        return _media_type(content_type) or "tipo sconosciuto"
+    content_length = headers.get("content-length")
+    if content_length and content_length.isdigit() and int(content_length) > max_bytes:
+        return f"{int(content_length) // 1024}KB"
+    return None
+
+
+def declared_charset(content_type, head_bytes):
+    """Charset dichiarato nell'header o in un <meta> iniziale; mai rilevamento automatico."""
+    match = CHARSET_PARAM_PATTERN.search(content_type or "")
+    charset = match.group(1) if match else None
+    if not charset:
+        meta_match = META_CHARSET_PATTERN.search(head_bytes[:CHARSET_SNIFF_BYTES])
+        charset = meta_match.group(1).decode("ascii", "ignore") if meta_match else None
+    try:
+        return codecs.lookup(charset).name if charset else DEFAULT_CHARSET
+    except LookupError:
+        return DEFAULT_CHARSET
+
+
+def build_response(url, status_code, headers, chunks, truncated, max_bytes=MAX_BODY_BYTES):
+    body = b"".join(chunks)[:max_bytes]
+    text = body.decode(declared_charset(headers.get("content-type"), body), errors="replace")
+    return CappedResponse(url, status_code, text, headers, truncated=truncated, body_bytes=len(body))
+
+
+def _counted(capped):
+    metrics = get_metrics()
+    metrics.inc("http_byte_scaricati", capped.body_bytes)
+    if capped.skipped:
+        metrics.inc("http_saltate")
+    if capped.truncated:
+        metrics.inc("http_troncate")
+    return capped
+
+
+def read_capped(response, max_bytes=MAX_BODY_BYTES):
+    """Legge in streaming una risposta requests (stream=True) entro max_bytes e la chiude."""
+    try:
+        reason = skip_reason(response.headers, max_bytes)
+        if reason:
+            return _counted(CappedResponse(response.url, response.status_code, "", response.headers, skipped=reason))
+        chunks, size, truncated = [], 0, False
+        for chunk in response.iter_content(STREAM_CHUNK_SIZE):
+            chunks.append(chunk)
+            size += len(chunk)
+            # Tagliata solo se c'è almeno un byte oltre la soglia: un corpo lungo esattamente max_bytes è completo.
+            if size > max_bytes:
+                truncated = True
+                break
+        return _counted(build_response(response.url, response.status_code, response.headers, chunks, truncated, max_bytes))
+    finally:
+        response.close()
+
+
+async def read_capped_async(response, max_bytes=MAX_BODY_BYTES):
+    """Come read_capped, per una risposta httpx aperta con client.stream(); la chiusura resta al chiamante."""
+    reason = skip_reason(response.headers, max_bytes)
+    if reason:
+        return _counted(CappedResponse(str(response.url), response.status_code, "", response.headers, skipped=reason))
+    chunks, size, truncated = [], 0, False
+    async for chunk in response.aiter_bytes(STREAM_CHUNK_SIZE):
+        chunks.append(chunk)
+        size += len(chunk)
+        if size > max_bytes:
+            truncated = True
+            break
+    return _counted(build_response(str(response.url), response.status_code, response.headers, chunks, truncated,
+                                   max_bytes))
@@ -0,0 +1,133 @@
+# run_store.py
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+
+RUN_STORE_PATH = ".cache/runs.sqlite3"
+RUNNING, COMPLETED = "running", "completed"
+PENDING, UTILE, SCARTO = "pending", "utile", "scarto"
+
+_run_store = None
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    run_id TEXT PRIMARY KEY,
+    params TEXT NOT NULL,
+    status TEXT NOT NULL,
+    llm_iterations INTEGER NOT NULL DEFAULT 0,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS run_companies (
+    run_id TEXT NOT NULL,
+    name_key TEXT NOT NULL,
+    domain TEXT NOT NULL,
+    name TEXT NOT NULL,
+    site TEXT NOT NULL,
+    status TEXT NOT NULL,
+    record TEXT,
+    seq INTEGER NOT NULL,
+    PRIMARY KEY (run_id, name_key, domain)
+);
+"""
+
+
+class RunStore:
+    """
+    Checkpoint su SQLite delle ricerche: parametri, aziende già proposte dall'LLM (anche quelle non
+    ancora visitate) e risultati classificati. Una ricerca interrotta si riprende dal suo run_id senza
+    ripetere lo scraping delle aziende già concluse.
+    """
+
+    def __init__(self, path=RUN_STORE_PATH):
+        self.path = path
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        # Connessione condivisa tra il thread produttore e il consumatore, serializzata dal lock.
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(SCHEMA)
+        self._lock = threading.Lock()
+
+    def create_run(self, params, run_id=None):
+        run_id = run_id or f"{time.strftime('%Y%m%d-%H%M%S')}-{uuid.uuid4().hex[:6]}"
+        now = time.time()
+        with self._lock:
+            self._conn.execute("INSERT INTO runs (run_id, params, status, created_at, updated_at) VALUES (?, ?, ?, ?, ?)",
+                               (run_id, json.dumps(params, ensure_ascii=False), RUNNING, now, now))
+        return run_id
+
+    def get_run(self, run_id):
+        with self._lock:
+            row = self._conn.execute("SELECT params, status, llm_iterations FROM runs WHERE run_id = ?",
+                                     (run_id,)).fetchone()
+        if row is None:
+            return None
+        return {"run_id": run_id, "params": json.loads(row[0]), "status": row[1], "llm_iterations": row[2]}
+
+    def list_runs(self, status=None, limit=20):
+        """Ricerche più recenti con il numero di risultati utili salvati."""
+        query = ("SELECT r.run_id, r.params, r.status, r.updated_at, "
+                 "(SELECT COUNT(*) FROM run_companies c WHERE c.run_id = r.run_id AND c.status = ?) "
+                 "FROM runs r" + (" WHERE r.status = ?" if status else "") + " ORDER BY r.updated_at DESC LIMIT ?")
+        args = (UTILE, status, limit) if status else (UTILE, limit)
+        with self._lock:
+            rows = self._conn.execute(query, args).fetchall()
+        return [{"run_id": r[0], "params": json.loads(r[1]), "status": r[2], "updated_at": r[3], "utili": r[4]}
+                for r in rows]
+
+    def set_llm_iterations(self, run_id, llm_iterations):
+        with self._lock:
+            self._conn.execute("UPDATE runs SET llm_iterations = ?, updated_at = ? WHERE run_id = ?",
+                               (llm_iterations, time.time(), run_id))
+
+    def mark_completed(self, run_id):
+        with self._lock:
+            self._conn.execute("UPDATE runs SET status = ?, updated_at = ? WHERE run_id = ?",
+                               (COMPLETED, time.time(), run_id))
+
+    def add_companies(self, run_id, companies):
+        """Registra [(nome, sito, dominio), ...] appena proposte dall'LLM, ancora da visitare."""
+        with self._lock:
+            next_seq = self._conn.execute("SELECT COALESCE(MAX(seq), 0) + 1 FROM run_companies WHERE run_id = ?",
+                                          (run_id,)).fetchone()[0]
+            self._conn.executemany(
+                "INSERT OR IGNORE INTO run_companies (run_id, name_key, domain, name, site, status, seq) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                [(run_id, name.lower(), domain, name, site, PENDING, next_seq + i)
+                 for i, (name, site, domain) in enumerate(companies)])
+
+    def record_result(self, run_id, name, domain, record, useful):
+        with self._lock:
+            self._conn.execute(
+                "UPDATE run_companies SET status = ?, record = ? WHERE run_id = ? AND name_key = ? AND domain = ?",
+                (UTILE if useful else SCARTO, json.dumps(record, ensure_ascii=False), run_id, name.lower(), domain))
+
+    def load_companies(self, run_id):
+        """(identificatori già visti in ordine di arrivo, aziende ancora da visitare [(nome, sito)], risultati [(record, utile)])."""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT name_key, domain, name, site, status, record FROM run_companies WHERE run_id = ? ORDER BY seq",
+                (run_id,)).fetchall()
+        identifiers, pending, results = [], [], []
+        for name_key, domain, name, site, status, record in rows:
+            identifiers.append((name_key, domain))
+            if status == PENDING:
+                pending.append((name, site))
+            else:
+                results.append((json.loads(record), status == UTILE))
+        return identifiers, pending, results
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+def get_run_store():
+    global _run_store
+    if _run_store is None:
+        _run_store = RunStore()
+    return _run_store
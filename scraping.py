@@ -0,0 +1,381 @@
+# scraping.py
+from urllib.parse import urlparse, urljoin
+import asyncio
+import cloudscraper
+import time
+import requests
+
+from utils import clean_valid_emails_batch, PRIORITY_KEYWORDS
+from extraction import extract_emails_and_piva
+from async_fetcher import AsyncFetchEngine, RETRYABLE_STATUS_CODES, CloudflareChallengeError, is_cloudflare_challenge
+from domain_health import DomainHealthRegistry
+from http_cache import HttpCache
+from contact_discovery import rank_sitemap_urls, merge_candidate_urls
+from response_limits import read_capped
+from metrics import get_metrics, STAGE_HTTP
+from parse_pool import ParsePool, analyze_page
+
+HEADERS = {
+    "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36"}
+CONTACT_PATHS = ["/contatti", "/contact", "/chi-siamo", "/about", "/legal", "/privacy"]
+MAX_EMAILS_PER_COMPANY = 3
+# Budget di richieste per sito: homepage + eventuale sitemap.xml + pagine contatti migliori.
+MAX_REQUESTS_PER_SITE = 5
+CONTACT_PAGES_TOP_N = 3
+_http_cache = None
+_domain_health = None
+
+try:
+    scraper = cloudscraper.create_scraper(
+        browser={"browser": "chrome", "platform": "windows", "mobile": False},
+    )
+except Exception as e:
+    print(f"Errore durante l'inizializzazione di cloudscraper: {e}")
+    scraper = None
+
+
+def get_http_cache():
+    global _http_cache
+    if _http_cache is None:
+        _http_cache = HttpCache()
+    return _http_cache
+
+
+def get_domain_health_registry():
+    global _domain_health
+    if _domain_health is None:
+        _domain_health = DomainHealthRegistry()
+    return _domain_health
+
+
+def create_fetch_engine(parse_workers=0, **kwargs):
+    """
+    Crea il motore di fetch asincrono con gli header standard dello scraper e la cache HTTP condivisa.
+    Con parse_workers > 0 il parsing delle pagine grandi passa a un pool di altrettanti processi.
+    Le pagine dietro una challenge Cloudflare vengono riscaricate con cloudscraper, come nel percorso sincrono.
+    """
+    parse_pool = ParsePool(parse_workers) if parse_workers > 0 else None
+    return AsyncFetchEngine(headers=HEADERS, cache=get_http_cache(), parse_pool=parse_pool,
+                            challenge_fallback=fetch_with_cloudscraper if scraper else None, **kwargs)
+
+
+def fetch_with_cloudscraper(url, timeout=8):
+    """Singola GET con cloudscraper (risolve le challenge Cloudflare), corpo letto entro MAX_BODY_BYTES."""
+    with get_metrics().timer(STAGE_HTTP):
+        streamed = scraper.get(url, timeout=timeout, headers=HEADERS, allow_redirects=True, stream=True)
+        return read_capped(streamed)
+
+
+async def _analyze_page(engine, html_text, url, contact_links_limit=0):
+    if engine.parse_pool:
+        return await engine.parse_pool.analyze(html_text, url, contact_links_limit)
+    return analyze_page(html_text, url, contact_links_limit)
+
+
+def get_with_retries(url, domain_health, max_retries=2, timeout=8, backoff_factor=0.3):
+    if not scraper: raise Exception("Scraper non inizializzato.")
+    try:
+        current_netloc = urlparse(url).netloc
+    except Exception as e_parse_url:
+        raise Exception(f"URL malformato: {url} - {e_parse_url}")
+
+    http_cache = get_http_cache()
+    cached_entry, fresh = http_cache.lookup(url)
+    if fresh: return http_cache.to_response(cached_entry)
+    metrics = get_metrics()
+    if not domain_health.allow_request(current_netloc):
+        metrics.inc("blacklist_hit")
+        raise Exception(f"Dominio {current_netloc} blacklistato.")
+    request_headers = {**HEADERS, **http_cache.validation_headers(cached_entry)}
+
+    for attempt in range(max_retries):
+        if attempt: metrics.inc("http_retry")
+        metrics.inc("http_richieste")
+        try:
+            with metrics.timer(STAGE_HTTP):
+                started = time.monotonic()
+                streamed = scraper.get(url, timeout=timeout, headers=request_headers, allow_redirects=True, stream=True)
+                challenged = is_cloudflare_challenge(streamed.status_code, streamed.headers)
+                if challenged or streamed.status_code not in RETRYABLE_STATUS_CODES:
+                    domain_health.record_success(current_netloc, time.monotonic() - started)
+                if challenged:
+                    # Challenge che nemmeno cloudscraper supera: il sito risponde, quindi non è un guasto.
+                    streamed.close()
+                    metrics.inc("cloudflare_challenge")
+                    raise CloudflareChallengeError(f"Challenge Cloudflare non superata su {url}.")
+                if streamed.status_code == 304 and cached_entry:
+                    streamed.close()
+                    return http_cache.mark_revalidated(url, cached_entry)
+                if streamed.status_code >= 400:
+                    streamed.close()
+                    streamed.raise_for_status()
+                # Corpo letto in streaming entro MAX_BODY_BYTES e decodificato con il charset dichiarato.
+                response = read_capped(streamed)
+            http_cache.store(url, response)
+            return response
+        except CloudflareChallengeError:
+            raise
+        except (requests.exceptions.ConnectionError, requests.exceptions.Timeout,
+                requests.exceptions.TooManyRedirects) as e:
+            metrics.inc("http_errori")
+            if attempt == max_retries - 1:
+                domain_health.record_failure(current_netloc, e)
+                raise Exception(f"Max retries {url}. Err:{type(e).__name__}") from e
+            time.sleep(backoff_factor * (2 ** attempt))
+        except requests.exceptions.HTTPError as eHttp:  # Rinominata per evitare conflitto con la 'e' esterna
+            metrics.inc("http_errori")
+            if eHttp.response.status_code in RETRYABLE_STATUS_CODES:
+                if attempt == max_retries - 1: domain_health.record_failure(current_netloc, eHttp); raise
+                time.sleep(backoff_factor * (2 ** attempt));
+                continue
+            raise
+        except Exception as eGeneral:  # Rinominata per evitare conflitto
+            metrics.inc("http_errori")
+            if attempt == max_retries - 1:
+                if "resolve" in str(eGeneral).lower() or "socket" in str(eGeneral).lower() or "connection" in str(
+                        eGeneral).lower():
+                    domain_health.record_failure(current_netloc, eGeneral)
+                raise
+            time.sleep(backoff_factor * (2 ** attempt))
+    return None
+
+
+def _contact_base_url(base_url, domain_health, statuses):
+    """Normalizza l'URL base per le pagine contatti; restituisce None (e annota lo stato) se non utilizzabile."""
+    try:
+        parsed_base = urlparse(base_url);
+        scheme = parsed_base.scheme or "https";
+        netloc = parsed_base.netloc or parsed_base.path.split('/')[0]
+        if not netloc: statuses.append(f"URL base non valido: {base_url}"); return None
+        if domain_health.is_blocked(netloc): statuses.append(f"Dominio base {netloc} blacklistato."); return None
+    except Exception as e:
+        statuses.append(f"Errore parsing URL {base_url}: {e}");
+        return None
+    return f"{scheme}://{netloc.rstrip('/')}"
+
+
+def is_contact_search_complete(emails, has_piva):
+    """Regola di stop: P.IVA trovata e già MAX_EMAILS_PER_COMPANY email con PRIORITY_KEYWORDS."""
+    if not has_piva: return False
+    priority_emails = [e for e in emails if any(k in e for k in PRIORITY_KEYWORDS)]
+    return len(priority_emails) >= MAX_EMAILS_PER_COMPANY
+
+
+def _contact_page_status(path, resp, emails_page, has_piva_page):
+    if resp and getattr(resp, "skipped", None):
+        return f"{path}:skip({resp.skipped})"
+    if resp and resp.status_code == 200:
+        return f"{path}:ok(E:{len(emails_page)},P:{'S' if has_piva_page else 'N'})"
+    return f"{path}:{resp.status_code}" if resp else None
+
+
+def _contact_targets(base_url_proper, candidate_urls, max_pages):
+    """Coppie (etichetta, URL) da interrogare: i link scoperti se presenti, altrimenti i percorsi fissi."""
+    urls = list(candidate_urls) if candidate_urls else [urljoin(base_url_proper, path) for path in CONTACT_PATHS]
+    if max_pages is not None: urls = urls[:max(0, max_pages)]
+    targets = []
+    for u in urls:
+        parsed = urlparse(u)
+        targets.append(((parsed.path or "/") + (f"?{parsed.query}" if parsed.query else ""), u))
+    return targets
+
+
+def try_common_contact_pages(base_url, domain_health, known_emails=(), known_piva=False, candidate_urls=None,
+                             max_pages=None):
+    found_emails_set, statuses, found_piva_overall = set(), [], False
+    base_url_proper = _contact_base_url(base_url, domain_health, statuses)
+    if not base_url_proper: return [], False, statuses
+    for path, contact_url in _contact_targets(base_url_proper, candidate_urls, max_pages):
+        if is_contact_search_complete(set(known_emails) | found_emails_set, known_piva or found_piva_overall):
+            statuses.append(f"{path}:stop")
+            continue
+        try:
+            resp = get_with_retries(contact_url, domain_health)
+            emails_page, has_piva_page = [], False
+            if resp and resp.status_code == 200:
+                emails_page, has_piva_page = extract_emails_and_piva(resp.text, contact_url)
+                found_emails_set.update(emails_page)
+                found_piva_overall = found_piva_overall or has_piva_page
+            page_status = _contact_page_status(path, resp, emails_page, has_piva_page)
+            if page_status: statuses.append(page_status)
+        except Exception as ePage:  # Rinominata per evitare conflitto
+            statuses.append(f"{path}:err({type(ePage).__name__})")
+    return list(found_emails_set), found_piva_overall, statuses
+
+
+async def _probe_contact_page(path, contact_url, domain_health, engine):
+    try:
+        resp = await engine.get(contact_url, domain_health)
+        emails_page, has_piva_page = [], False
+        if resp and resp.status_code == 200:
+            emails_page, has_piva_page, _ = await _analyze_page(engine, resp.text, contact_url)
+        return contact_url, emails_page, has_piva_page, _contact_page_status(path, resp, emails_page, has_piva_page)
+    except Exception as ePage:
+        return contact_url, [], False, f"{path}:err({type(ePage).__name__})"
+
+
+async def try_common_contact_pages_async(base_url, domain_health, engine, known_emails=(), known_piva=False,
+                                         candidate_urls=None, max_pages=None):
+    """
+    Interroga tutte le pagine contatti del dominio in parallelo.
+    Appena la regola di stop è soddisfatta (anche con quanto già trovato in homepage) le richieste
+    ancora in corso vengono annullate.
+    """
+    found_emails_set, statuses, found_piva_overall = set(), [], False
+    base_url_proper = _contact_base_url(base_url, domain_health, statuses)
+    if not base_url_proper: return [], False, statuses
+    targets = _contact_targets(base_url_proper, candidate_urls, max_pages)
+    if is_contact_search_complete(known_emails, known_piva):
+        return [], False, [f"{path}:stop" for path, _ in targets]
+
+    tasks = [asyncio.ensure_future(_probe_contact_page(path, contact_url, domain_health, engine))
+             for path, contact_url in targets]
+    # Indicizzati per URL completo: candidati con lo stesso percorso e query diverse restano distinti.
+    status_by_url = {}
+    try:
+        for next_done in asyncio.as_completed(tasks):
+            contact_url, emails_page, has_piva_page, page_status = await next_done
+            found_emails_set.update(emails_page)
+            found_piva_overall = found_piva_overall or has_piva_page
+            if page_status: status_by_url[contact_url] = page_status
+            if is_contact_search_complete(set(known_emails) | found_emails_set, known_piva or found_piva_overall):
+                break
+    finally:
+        pending = [t for t in tasks if not t.done()]
+        for t in pending: t.cancel()
+        if pending: await asyncio.gather(*pending, return_exceptions=True)
+    # Stati nell'ordine di priorità dei target, così il riepilogo resta confrontabile tra aziende.
+    for path, contact_url in targets:
+        statuses.append(status_by_url.get(contact_url, f"{path}:stop"))
+    return list(found_emails_set), found_piva_overall, statuses
+
+
+def _needs_sitemap(candidate_urls, emails_home, piva_home):
+    return len(candidate_urls) < CONTACT_PAGES_TOP_N and not is_contact_search_complete(emails_home, piva_home)
+
+
+def _sitemap_candidates(sitemap_resp, base_url):
+    if sitemap_resp and sitemap_resp.status_code == 200:
+        return rank_sitemap_urls(sitemap_resp.text, base_url, CONTACT_PAGES_TOP_N)
+    return []
+
+
+def _format_final_status(final_emails_list, overall_piva_found, status_home, contact_statuses_str):
+    s_list = []  # Rinominata da 's' per evitare confusione con la 's' usata come nome variabile per stringhe altrove
+    if final_emails_list: s_list.append("E")
+    if overall_piva_found: s_list.append("P")
+    found_str = "&".join(s_list) if s_list else "Nulla"
+    final_status = f"{found_str}. {status_home}. C:{contact_statuses_str}"
+    return final_status.strip()
+
+
+def _merge_company_emails(emails_home, emails_contact_list):
+    cleaned_emails = list(clean_valid_emails_batch(emails_home + emails_contact_list))
+    cleaned_emails.sort(key=lambda e: (not any(k in e for k in PRIORITY_KEYWORDS), e))
+    return cleaned_emails[:MAX_EMAILS_PER_COMPANY]
+
+
+def _summarize_contact_statuses(contact_statuses):
+    return (', '.join(contact_statuses[:2]) + (
+        '...' if len(contact_statuses) > 2 else '')) if contact_statuses else "N/A"
+
+
+class _SiteScrape:
+    """
+    Stato e passi comuni dello scraping di un sito (homepage -> eventuale sitemap -> pagine contatti).
+    extract_emails_from_url e la sua versione asincrona fanno solo l'I/O e passano qui le risposte.
+    """
+
+    def __init__(self, url):
+        self.url = self.home_url = url
+        self.emails_home, self.piva_home, self.candidate_urls, self.requests_used = [], False, [], 0
+        self.final_emails, self.piva_found = [], False
+        self.status_home, self.contact_statuses_str = "Non tentato", "Non tentato"
+
+    def check_url(self, domain_health):
+        """URL della homepage con lo schema; eccezione se il dominio è bloccato."""
+        if not urlparse(self.url).scheme: self.url = self.home_url = "https://" + self.url
+        netloc = urlparse(self.url).netloc
+        if domain_health.is_blocked(netloc): raise Exception(f"Dominio {netloc} blacklistato.")
+        return self.url
+
+    def home_response(self, response_home):
+        """Annota l'esito della homepage; True se il corpo va analizzato."""
+        self.requests_used += 1
+        if response_home and getattr(response_home, "skipped", None):
+            self.status_home = f"H:skip({response_home.skipped})"
+        elif response_home and response_home.status_code == 200:
+            # I link relativi vanno risolti rispetto all'URL finale, dopo i redirect.
+            self.home_url = str(response_home.url or self.url)
+            return True
+        elif response_home:
+            self.status_home = f"H:{response_home.status_code}"
+        return False
+
+    def home_analysis(self, emails_home, piva_home, candidate_urls):
+        self.emails_home, self.piva_home, self.candidate_urls = emails_home, piva_home, candidate_urls
+        self.status_home = f"H:ok(E:{len(emails_home)},P:{'S' if piva_home else 'N'})"
+
+    def sitemap_url(self):
+        """URL della sitemap da scaricare, None se i link della homepage bastano."""
+        if not _needs_sitemap(self.candidate_urls, self.emails_home, self.piva_home): return None
+        self.requests_used += 1
+        return urljoin(self.home_url, "/sitemap.xml")
+
+    def sitemap_response(self, sitemap_resp):
+        self.candidate_urls = merge_candidate_urls(
+            self.candidate_urls, _sitemap_candidates(sitemap_resp, self.home_url), limit=CONTACT_PAGES_TOP_N)
+
+    def contact_pages_args(self):
+        """Argomenti per try_common_contact_pages(_async) dopo base_url, domain_health (ed engine)."""
+        return self.emails_home, self.piva_home, self.candidate_urls, MAX_REQUESTS_PER_SITE - self.requests_used
+
+    def contact_results(self, emails_contact_list, piva_contact_pages, contact_statuses):
+        self.contact_statuses_str = _summarize_contact_statuses(contact_statuses)
+        self.final_emails = _merge_company_emails(self.emails_home, emails_contact_list)
+        self.piva_found = self.piva_home or piva_contact_pages
+
+    def failed(self, e):
+        self.status_home = f"H:Err({type(e).__name__})"  # Non mostra l'intero errore per brevità
+
+    def result(self):
+        return self.final_emails, self.piva_found, _format_final_status(
+            self.final_emails, self.piva_found, self.status_home, self.contact_statuses_str)
+
+
+def extract_emails_from_url(url, domain_health):
+    site = _SiteScrape(url)
+    try:
+        response_home = get_with_retries(site.check_url(domain_health), domain_health)
+        if site.home_response(response_home):
+            site.home_analysis(*analyze_page(response_home.text, site.home_url, CONTACT_PAGES_TOP_N))
+            sitemap_url = site.sitemap_url()
+            if sitemap_url:
+                try:
+                    site.sitemap_response(get_with_retries(sitemap_url, domain_health))
+                except Exception:
+                    pass
+        site.contact_results(*try_common_contact_pages(site.url, domain_health, *site.contact_pages_args()))
+    except Exception as e:
+        site.failed(e)
+    return site.result()
+
+
+async def extract_emails_from_url_async(url, domain_health, engine):
+    """Stesso contratto di extract_emails_from_url, ma con le richieste servite da un AsyncFetchEngine."""
+    site = _SiteScrape(url)
+    try:
+        response_home = await engine.get(site.check_url(domain_health), domain_health)
+        if site.home_response(response_home):
+            site.home_analysis(*await _analyze_page(engine, response_home.text, site.home_url, CONTACT_PAGES_TOP_N))
+            sitemap_url = site.sitemap_url()
+            if sitemap_url:
+                try:
+                    site.sitemap_response(await engine.get(sitemap_url, domain_health))
+                except Exception:
+                    pass
+        site.contact_results(*await try_common_contact_pages_async(site.url, domain_health, engine,
+                                                                   *site.contact_pages_args()))
+    except Exception as e:
+        site.failed(e)
+    return site.result()
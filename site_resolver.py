@@ -0,0 +1,139 @@
+# site_resolver.py
+import logging
+import re
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlparse
+
+from diskcache import Cache
+
+from rate_limit import TokenBucket
+from metrics import get_metrics, StatCounters, bind_metrics, STAGE_SITE_SEARCH
+
+SITE_CACHE_DIR = ".cache/sites"
+SITE_CACHE_TTL_SECONDS = 30 * 24 * 3600
+SITE_CACHE_NEGATIVE_TTL_SECONDS = 7 * 24 * 3600  # "nessun sito trovato" scade prima: la ricerca può migliorare
+SITE_CACHE_SIZE_LIMIT = 16 * 1024 * 1024
+SEARCH_RATE_PER_SECOND = 1.0  # Ricerche al secondo verso il motore, condivise tra tutti i thread.
+SEARCH_BURST = 2
+SEARCH_WORKERS = 4
+SEARCH_RESULTS_PER_QUERY = 3
+SEARCH_TIMEOUT = 5
+EXCLUDED_SITE_DOMAINS = ("facebook.com", "linkedin.com", "instagram.com", "twitter.com", "google.com",
+                         "paginegialle.it")
+HTML_EXTENSIONS = (".html", ".htm", ".php")
+NAME_SEPARATORS = re.compile(r"\s+")
+
+_site_resolver = None
+
+
+class GoogleSearchBackend:
+    """Backend predefinito: googlesearch-python. Le pause tra le query le gestisce il token bucket del resolver."""
+
+    def search(self, query):
+        from googlesearch import search
+        return list(search(query, num_results=SEARCH_RESULTS_PER_QUERY, lang="it", sleep_interval=0,
+                           timeout=SEARCH_TIMEOUT))
+
+
+class StaticSearchBackend:
+    """Backend locale per test e benchmark: {query: [url, ...]} con una latenza simulata opzionale."""
+
+    def __init__(self, results, latency=0.0):
+        self.results = results
+        self.latency = latency
+
+    def search(self, query):
+        if self.latency:
+            time.sleep(self.latency)
+        return list(self.results.get(query, []))
+
+
+def pick_official_site(urls):
+    """Primo risultato che sembra il sito ufficiale (niente social, directory o file)."""
+    for url in urls:
+        parsed = urlparse(url)
+        netloc = parsed.netloc.lower()
+        if parsed.scheme not in ("http", "https") or any(d in netloc for d in EXCLUDED_SITE_DOMAINS):
+            continue
+        last_segment = parsed.path.split("/")[-1]
+        if "#" in parsed.path or ("." in last_segment and not parsed.path.endswith(HTML_EXTENSIONS)):
+            if parsed.path not in ("/", ""):
+                continue
+        if "." in netloc and len(netloc.split(".")) <= 4 and len(netloc.split(".")[-1]) >= 2:
+            return url
+    return None
+
+
+def _name_key(name):
+    return NAME_SEPARATORS.sub(" ", name.strip().lower())
+
+
+class SiteResolver:
+    """
+    Risolve nome azienda -> sito ufficiale con una ricerca web.
+    I risultati (anche quelli negativi) restano in cache su disco, le ricerche partono in parallelo
+    ma rispettano un unico token bucket, e il motore di ricerca è un backend intercambiabile.
+    """
+
+    def __init__(self, backend=None, directory=SITE_CACHE_DIR, rate=SEARCH_RATE_PER_SECOND, burst=SEARCH_BURST,
+                 max_workers=SEARCH_WORKERS):
+        self.backend = backend or GoogleSearchBackend()
+        self.max_workers = max_workers
+        self._bucket = TokenBucket(rate, burst)
+        self._cache = Cache(directory, size_limit=SITE_CACHE_SIZE_LIMIT, eviction_policy="least-recently-used")
+        self._counters = StatCounters("hit", "hit_negativi", "ricerche", "errori")
+
+    def reset_stats(self):
+        self._counters.reset()
+
+    def stats(self):
+        return self._counters.snapshot()
+
+    def resolve(self, name, log_func=None):
+        """Sito trovato per name oppure None. Gli errori di rete non vengono memorizzati come risultati negativi."""
+        log = log_func or logging.info
+        key = _name_key(name)
+        if not key:
+            return None
+        cached = self._cache.get(key)
+        if cached is not None:
+            self._counters.inc("hit" if cached else "hit_negativi")
+            return cached or None
+
+        query = f"{name} sito ufficiale"
+        self._bucket.acquire()
+        self._counters.inc("ricerche")
+        log(f"Google: '{query}'")
+        try:
+            with get_metrics().timer(STAGE_SITE_SEARCH):
+                urls = self.backend.search(query)
+        except Exception as e:
+            self._counters.inc("errori")
+            log(f"Err Google '{name}': {e}")
+            return None
+        for url in urls:
+            log(f"Google res: {url}")
+        site = pick_official_site(urls)
+        self._cache.set(key, site or "", expire=SITE_CACHE_TTL_SECONDS if site else SITE_CACHE_NEGATIVE_TTL_SECONDS)
+        return site
+
+    def resolve_many(self, names, log_func=None):
+        """Risolve più nomi in parallelo; restituisce {nome: sito o None} nell'ordine ricevuto."""
+        unique_names = list(dict.fromkeys(names))
+        if len(unique_names) <= 1:
+            return {name: self.resolve(name, log_func) for name in unique_names}
+        with ThreadPoolExecutor(max_workers=min(self.max_workers, len(unique_names)),
+                                thread_name_prefix="site-resolver") as executor:
+            sites = executor.map(bind_metrics(lambda n: self.resolve(n, log_func)), unique_names)
+            return dict(zip(unique_names, sites))
+
+    def clear(self):
+        self._cache.clear()
+
+
+def get_site_resolver():
+    global _site_resolver
+    if _site_resolver is None:
+        _site_resolver = SiteResolver()
+    return _site_resolver
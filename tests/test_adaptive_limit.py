@@ -0,0 +1,44 @@
+# tests/test_adaptive_limit.py
+import asyncio
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from adaptive_limit import AdaptiveLimiter
+
+
+def test_cancel_after_wake_keeps_cancellation_and_slots():
+    async def scenario():
+        limiter = AdaptiveLimiter(1, 1, 1)
+        await limiter.acquire()
+        waiter_task = asyncio.create_task(limiter.acquire())
+        await asyncio.sleep(0)  # Il task ora aspetta in coda.
+        waiter_task.cancel()
+        # Il futuro in coda è già annullato: release() lo scarta in _wake_waiters prima che il task
+        # riprenda, quindi la rimozione nel ramo CancelledError non lo trova più nella coda.
+        limiter.release()
+        try:
+            await waiter_task
+        except asyncio.CancelledError:
+            pass
+        else:
+            raise AssertionError("l'annullamento è andato perso")
+        assert limiter.in_flight == 0 and not limiter._waiters
+        await asyncio.wait_for(limiter.acquire(), timeout=1)
+        assert limiter.in_flight == 1
+
+    asyncio.run(scenario())
+
+
+def test_cancel_while_waiting_removes_waiter():
+    async def scenario():
+        limiter = AdaptiveLimiter(1, 1, 1)
+        await limiter.acquire()
+        waiter_task = asyncio.create_task(limiter.acquire())
+        await asyncio.sleep(0)
+        waiter_task.cancel()
+        await asyncio.gather(waiter_task, return_exceptions=True)
+        assert not limiter._waiters and limiter.in_flight == 1
+
+    asyncio.run(scenario())
@@ -1,37 +1,53 @@
 # utils.py
 import re
+from functools import lru_cache
 from email_validator import validate_email, EmailNotValidError
 from llama_cpp import Llama
 
+from metrics import get_metrics, STAGE_EMAIL_VALIDATION
+
 EMAIL_CANDIDATE_REGEX = r"[a-zA-Z0-9_.+-]+@[a-zA-Z0-9-]+\.[a-zA-Z0-9-.]+"
 _llm = None
 
 PRIORITY_KEYWORDS = ["hr", "risorse", "human", "info", "lavoro"]
 
-from email_validator import validate_email, EmailNotValidError
+# Costanti precalcolate una volta sola invece che a ogni chiamata.
+PEC_KEYWORDS_PATTERN = re.compile("|".join(re.escape(k) for k in ["pec", "postacert", "legalmail", ".gov", ".giustizia"]))
+ALLOWED_TLDS = frozenset(["com", "it", "gov", "net", "org", "info", "edu", "mil", "ru", "cn", "uk", "io", "int", "mobi",
+                          "biz", "fr", "de", "xyz", "sale", "career"])
+EMAIL_VALIDATION_CACHE_SIZE = 50000
+
+
+@lru_cache(maxsize=EMAIL_VALIDATION_CACHE_SIZE)
+def validate_candidate_email(candidate):
+    """Valida un singolo candidato e restituisce l'email normalizzata, oppure None se va scartato."""
+    try:
+        email = validate_email(candidate, check_deliverability=False).email.lower()
+    except EmailNotValidError:
+        return None
+    if PEC_KEYWORDS_PATTERN.search(email):
+        return None
+    if email[0] in "0123456789":
+        return None
+    if email.rsplit(".", 1)[-1] not in ALLOWED_TLDS:
+        return None
+    return email
+
+
+def clean_valid_emails_batch(candidates):
+    """Versione batch: deduplica i candidati prima di validarli e restituisce un set di email valide."""
+    valid_emails = set()
+    with get_metrics().timer(STAGE_EMAIL_VALIDATION):
+        for candidate in set(candidates):
+            email = validate_candidate_email(candidate)
+            if email:
+                valid_emails.add(email)
+    return valid_emails
+
 
 def clean_valid_emails(emails):
-    valid_emails = []
-    pec_keywords = ["pec", "postacert", "legalmail", ".gov", ".giustizia"]
-    for e in emails:
-        try:
-            valid = validate_email(e, check_deliverability=False)
-            email = valid.email.lower()
-
-            domain = email.split("@")[1]
-            ext = domain.split(".")[-1]
-
-            if any(k in email for k in pec_keywords):
-                continue
-            if email.startswith(tuple("0123456789")):
-                continue
-            if ext not in ["com", "it", "gov", "net", "org", "info", "edu", "mil", "ru", "cn", "uk", "io", "int", "mobi", "biz", "fr", "de", "xyz", "sale", "career"]:
-                continue
-
-            valid_emails.append(email)
-        except EmailNotValidError:
-            continue
-    return list(set(valid_emails))
+    return list(clean_valid_emails_batch(emails))
+
 
 def get_llm():
     global _llm
@@ -3,6 +3,7 @@ import logging
 from google import genai
 from google.genai import types
 from dotenv import load_dotenv
+from llm_cache import get_llm_cache
 
 load_dotenv() #Looks for the .env file in the files of the project.
 
@@ -21,17 +22,27 @@ client = genai.Client(api_key=GEMINI_API_KEY)
 
 
 
-def call_gemini_flash(prompt):
-    response = client.models.generate_content(
-        model="gemini-2.0-flash", #gemini-2.5-flash-preview-05-20
-        contents=prompt,
-        config=types.GenerateContentConfig(
-            system_instruction= "Sei un esperto di marketing. Il tuo output è SOLO un elenco di aziende nel formato <Nome Azienda> - <Sito Web>, niente altro.",
-            temperature=0.9,
-            max_output_tokens=800
+COMPANY_LIST_MODEL = "gemini-2.0-flash"  # gemini-2.5-flash-preview-05-20
+COMPANY_LIST_SYSTEM_INSTRUCTION = "Sei un esperto di marketing. Il tuo output è SOLO un elenco di aziende nel formato <Nome Azienda> - <Sito Web>, niente altro."
+COMPANY_LIST_TEMPERATURE = 0.9
+COMPANY_LIST_MAX_TOKENS = 800
+
+
+def call_gemini_flash(prompt, use_cache=True):
+    def _generate():
+        response = client.models.generate_content(
+            model=COMPANY_LIST_MODEL,
+            contents=prompt,
+            config=types.GenerateContentConfig(
+                system_instruction=COMPANY_LIST_SYSTEM_INSTRUCTION,
+                temperature=COMPANY_LIST_TEMPERATURE,
+                max_output_tokens=COMPANY_LIST_MAX_TOKENS
+            )
         )
-    )
-    # Logga la risposta grezza
-    logging.debug(f"📥 Risposta grezza da Gemini: {response.text}")
+        # Logga la risposta grezza
+        logging.debug(f"📥 Risposta grezza da Gemini: {response.text}")
+        return response.text
 
-    return response.text
+    # use_cache=False quando si vuole una lista nuova anche per un prompt già visto.
+    return get_llm_cache().get_or_call(COMPANY_LIST_MODEL, prompt, COMPANY_LIST_SYSTEM_INSTRUCTION,
+                                       COMPANY_LIST_TEMPERATURE, COMPANY_LIST_MAX_TOKENS, _generate, use_cache)